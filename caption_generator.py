@@ -1,59 +1,320 @@
 import logging
+import os
+import copy
 import torch
+from contextlib import nullcontext
+import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
+from typing import List, Optional, Dict, Any, Iterator, Tuple
 from transformers import AutoProcessor, AutoModelForCausalLM
 import warnings
+from database import ImageDatabase
+from utils import file_cache_key
 
 # Suppress timm FutureWarning
 warnings.filterwarnings("ignore", category=FutureWarning)
 
+FLORENCE_MODEL_ID = "microsoft/Florence-2-large"
+
+_instance = None
+_instance_lock = threading.Lock()
+
+# libjpeg-turbo's SIMD decoder is several times faster than stock Pillow for JPEGs
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _turbo_jpeg = TurboJPEG()
+except Exception:
+    _turbo_jpeg = None
+
+
+# Florence-2's processor resizes every image to this size
+FLORENCE_INPUT_SIZE = (768, 768)
+
+# Placeholders returned instead of a caption when generation fails; they are shown but never cached
+CAPTION_UNAVAILABLE = "Caption unavailable: Model not loaded"
+CAPTION_ERROR_PREFIX = "Error generating caption: "
+
+
+def _turbo_scaling_factor(width: int, height: int, min_size: Tuple[int, int]) -> Optional[Tuple[int, int]]:
+    # Smallest DCT scale that still covers min_size, so no detail the model would see is lost
+    for num, denom in sorted(_turbo_jpeg.scaling_factors, key=lambda f: f[0] / f[1]):
+        if num <= denom and width * num // denom >= min_size[0] and height * num // denom >= min_size[1]:
+            return (num, denom)
+    return None
+
+
+def load_rgb_image(image_path: str, min_size: Optional[Tuple[int, int]] = None) -> Image.Image:
+    # min_size allows a cheaper reduced-scale JPEG decode when only that resolution is needed
+    if _turbo_jpeg is not None and image_path.lower().endswith(('.jpg', '.jpeg')):
+        try:
+            with open(image_path, "rb") as f:
+                data = f.read()
+            scaling_factor = None
+            if min_size is not None:
+                width, height, _, _ = _turbo_jpeg.decode_header(data)
+                scaling_factor = _turbo_scaling_factor(width, height, min_size)
+            return Image.fromarray(_turbo_jpeg.decode(data, pixel_format=TJPF_RGB, scaling_factor=scaling_factor))
+        except Exception as e:
+            logging.debug(f"TurboJPEG decode failed for {image_path}, falling back to Pillow: {str(e)}")
+    with Image.open(image_path) as img:
+        if min_size is not None:
+            # JPEG draft mode decodes at a reduced DCT scale no smaller than min_size
+            img.draft("RGB", min_size)
+        return img.convert("RGB")
+
+
+def is_caption_failure(caption: str) -> bool:
+    return caption == CAPTION_UNAVAILABLE or caption.startswith(CAPTION_ERROR_PREFIX)
+
+
+def image_size(image_path: str) -> Tuple[int, int]:
+    # Reads only the header; post-processing needs the original size, not the decoded pixels
+    with Image.open(image_path) as img:
+        return img.size
+
+
+def cached_caption(image_path: str, metadata: Optional[Dict[str, Any]]) -> Optional[str]:
+    # A stored caption is valid if the file is unchanged; rows without a hash predate hashing
+    if not metadata or not metadata.get('detailed_caption') or is_caption_failure(metadata['detailed_caption']):
+        return None
+    stored_hash = metadata.get('content_hash')
+    if stored_hash is not None:
+        try:
+            if stored_hash != file_cache_key(image_path):
+                return None
+        except OSError:
+            return None
+    return metadata['detailed_caption']
+
+
+class _VisionFeatures(torch.nn.Module):
+    # Exposes Florence-2's unpooled vision features as a plain forward() for ONNX export
+    def __init__(self, vision_tower):
+        super().__init__()
+        self.vision_tower = vision_tower
+
+    def forward(self, pixel_values):
+        return self.vision_tower.forward_features_unpool(pixel_values)
+
+
 class CaptionGenerator:
-    def __init__(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+    def __init__(self, quantization: Optional[str] = None, num_beams: int = 1, max_new_tokens: int = 128):
+        if torch.cuda.is_available():
+            self.device = "cuda"
+        elif torch.backends.mps.is_available():
+            self.device = "mps"
+        else:
+            self.device = "cpu"
+        self.dtype = torch.bfloat16 if self.device == "cpu" else torch.float16
+        self.quantization = quantization
+        # Greedy decoding by default; beam search triples decode cost for marginal caption gains
+        self.num_beams = num_beams
+        # Detailed captions rarely exceed ~80 tokens; raise this for longer output
+        self.max_new_tokens = max_new_tokens
+        self._prompt_ids = {}
+        # Dedicated stream so host-to-device copies overlap with generate() on the default stream
+        self._copy_stream = torch.cuda.Stream() if self.device == "cuda" else None
+        # The UI and the gallery scan both caption in background threads; only one may drive the model
+        self._model_lock = threading.Lock()
         self.model = None
         self.processor = None
         self.initialized = False
+        # Florence-2 is loaded on first use (or by an explicit load_model() call) so startup isn't blocked on it
+        self._load_lock = threading.Lock()
+        self._load_attempted = False
+
+    def load_model(self) -> bool:
+        with self._load_lock:
+            if self._load_attempted:
+                return self.initialized
+            self._load_attempted = True
+            try:
+                logging.info(f"Loading Florence-2 model on {self.device} ({self.dtype})")
+                model_source = self._resolve_model_source()
+                quantization_config = self._quantization_config()
+                if quantization_config is not None:
+                    # device_map handles placement for bitsandbytes-quantized weights
+                    self.model = AutoModelForCausalLM.from_pretrained(
+                        model_source,
+                        trust_remote_code=True,
+                        torch_dtype=self.dtype,
+                        quantization_config=quantization_config,
+                        device_map=self.device
+                    )
+                else:
+                    self.model = AutoModelForCausalLM.from_pretrained(
+                        model_source,
+                        trust_remote_code=True,
+                        torch_dtype=self.dtype
+                    ).to(self.device)
+                self.model.eval()
+                self.model.config.use_cache = True
+                self.processor = AutoProcessor.from_pretrained(
+                    model_source,
+                    trust_remote_code=True
+                )
+                if self.device == "cuda":
+                    self._compile_model()
+                    self._warmup()
+                elif self.device == "cpu":
+                    self._use_onnx_vision_encoder()
+                self.initialized = True
+                logging.info("Florence-2 model loaded successfully")
+            except Exception as e:
+                logging.exception(f"Error loading Florence-2 model: {str(e)}")
+                self.initialized = False
+            return self.initialized
+
+    def _resolve_model_source(self) -> str:
+        # Loading from the local snapshot skips the hub HEAD requests on warm starts
         try:
-            logging.info(f"Loading Florence-2 model on {self.device}")
-            self.model = AutoModelForCausalLM.from_pretrained(
-                "microsoft/Florence-2-large",
-                trust_remote_code=True,
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32
-            ).to(self.device)
-            self.model.eval()
-            self.processor = AutoProcessor.from_pretrained(
-                "microsoft/Florence-2-large",
-                trust_remote_code=True
+            from huggingface_hub import snapshot_download
+            local_path = snapshot_download(FLORENCE_MODEL_ID, local_files_only=True)
+            logging.debug(f"Using cached Florence-2 snapshot at {local_path}")
+            return local_path
+        except Exception:
+            logging.info("Florence-2 not cached locally; loading from the Hugging Face hub")
+            return FLORENCE_MODEL_ID
+
+    def _quantization_config(self):
+        if not self.quantization:
+            return None
+        if self.device != "cuda":
+            logging.warning(f"{self.quantization} quantization requires CUDA; loading Florence-2 unquantized")
+            return None
+        try:
+            from transformers import BitsAndBytesConfig
+            if self.quantization == "4bit":
+                config = BitsAndBytesConfig(
+                    load_in_4bit=True,
+                    bnb_4bit_quant_type="nf4",
+                    bnb_4bit_use_double_quant=True,
+                    bnb_4bit_compute_dtype=self.dtype
+                )
+            elif self.quantization == "8bit":
+                config = BitsAndBytesConfig(load_in_8bit=True)
+            else:
+                logging.warning(f"Unknown quantization '{self.quantization}'; loading Florence-2 unquantized")
+                return None
+            logging.info(f"Loading Florence-2 with {self.quantization} bitsandbytes quantization")
+            return config
+        except ImportError as e:
+            logging.warning(f"bitsandbytes quantization unavailable, loading Florence-2 unquantized: {str(e)}")
+            return None
+
+    def _use_onnx_vision_encoder(self):
+        # torch.compile doesn't help on CPU; run the vision tower through ONNX Runtime instead
+        try:
+            import onnxruntime
+        except ImportError:
+            logging.info("onnxruntime not installed; running Florence-2 vision encoder in PyTorch")
+            return
+        vision_tower = getattr(self.model, "vision_tower", None)
+        if vision_tower is None or self.quantization:
+            return
+        try:
+            # The export is only reusable for the exact weights it came from, so the model revision is in the name;
+            # without a known revision it is re-exported on every load
+            revision = getattr(self.model.config, "_commit_hash", None)
+            onnx_path = os.path.expanduser(
+                f"~/.cache/spg/{FLORENCE_MODEL_ID.replace('/', '--')}-{revision or 'unversioned'}-vision.onnx"
             )
-            self.initialized = True
-            logging.info("Florence-2 model loaded successfully")
+            if revision is None or not os.path.exists(onnx_path):
+                logging.info(f"Exporting Florence-2 vision encoder to {onnx_path}")
+                os.makedirs(os.path.dirname(onnx_path), exist_ok=True)
+                export_module = _VisionFeatures(copy.deepcopy(vision_tower).float()).eval()
+                # Export beside the target and rename, so a crash mid-export never leaves a partial model in place
+                tmp_path = f"{onnx_path}.{os.getpid()}.tmp"
+                try:
+                    torch.onnx.export(
+                        export_module,
+                        torch.zeros(1, 3, 768, 768),
+                        tmp_path,
+                        input_names=["pixel_values"],
+                        output_names=["features"],
+                        dynamic_axes={"pixel_values": {0: "batch"}, "features": {0: "batch"}},
+                        opset_version=17
+                    )
+                    os.replace(tmp_path, onnx_path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+            
+            sess_options = onnxruntime.SessionOptions()
+            sess_options.intra_op_num_threads = os.cpu_count()
+            session = onnxruntime.InferenceSession(onnx_path, sess_options, providers=["CPUExecutionProvider"])
+            
+            def forward_features_unpool(pixel_values):
+                features = session.run(None, {"pixel_values": pixel_values.float().numpy()})[0]
+                return torch.from_numpy(features).to(pixel_values.dtype)
+            
+            vision_tower.forward_features_unpool = forward_features_unpool
+            logging.info("Florence-2 vision encoder running on ONNX Runtime")
         except Exception as e:
-            logging.exception(f"Error loading Florence-2 model: {str(e)}")
-            self.initialized = False
+            logging.warning(f"ONNX export of Florence-2 vision encoder failed, using PyTorch: {str(e)}")
+
+    def _compile_model(self):
+        # CPU compile of transformers models tends to be slower, so only compile on CUDA
+        if not hasattr(torch, "compile"):
+            logging.info("torch.compile unavailable; running Florence-2 eagerly")
+            return
+        try:
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+            torch._dynamo.config.cache_size_limit = 128
+            # Florence-2 delegates generate() to its language model, so compile that forward
+            target = getattr(self.model, "language_model", self.model)
+            target.forward = torch.compile(target.forward, mode="reduce-overhead", fullgraph=False, dynamic=True)
+            logging.info("Compiled Florence-2 with torch.compile(mode='reduce-overhead')")
+        except Exception as e:
+            logging.warning(f"torch.compile failed, running Florence-2 eagerly: {str(e)}")
+
+    def _warmup(self, iterations: int = 3):
+        # Run a few fixed-shape generate() calls so cuBLAS/cuDNN autotuning and
+        # allocator growth happen at load time instead of on the first real caption
+        try:
+            logging.info(f"Warming up Florence-2 with {iterations} dummy generate() calls")
+            dummy = Image.new("RGB", FLORENCE_INPUT_SIZE)
+            inputs = self.processor(text="<DETAILED_CAPTION>", images=dummy, return_tensors="pt").to(self.device, self.dtype)
+            for _ in range(iterations):
+                self._run_generate(inputs, max_new_tokens=16)
+            torch.cuda.synchronize()
+            logging.info("Florence-2 warmup completed")
+        except Exception as e:
+            logging.warning(f"Florence-2 warmup failed, continuing without it: {str(e)}")
+
+    def _run_generate(self, inputs, max_new_tokens: Optional[int] = None):
+        generate_kwargs = {}
+        if self.num_beams > 1:
+            generate_kwargs.update(early_stopping=True, length_penalty=1.0)
+        
+        # Autocast on MPS is incomplete across torch versions; the model is already fp16 there
+        autocast = nullcontext() if self.device == "mps" else torch.autocast(device_type=self.device, dtype=self.dtype)
+        with self._model_lock, torch.inference_mode(), autocast:
+            return self.model.generate(
+                input_ids=inputs["input_ids"],
+                pixel_values=inputs["pixel_values"],
+                max_new_tokens=max_new_tokens or self.max_new_tokens,
+                num_beams=self.num_beams,
+                do_sample=False,
+                **generate_kwargs
+            )
 
     def is_initialized(self):
         return self.initialized
 
     def generate_image_caption(self, image_path: str) -> str:
-        if not self.initialized:
+        if not self.load_model():
             logging.warning(f"Cannot generate caption for {image_path}: Florence-2 model not loaded")
-            return "Caption unavailable: Model not loaded"
+            return CAPTION_UNAVAILABLE
         
         try:
             logging.debug(f"Generating caption for {image_path}")
-            image = Image.open(image_path).convert("RGB")
+            inputs = self._to_device(self._build_inputs([image_path], "<DETAILED_CAPTION>"))
             
-            prompt = "<DETAILED_CAPTION>"
-            inputs = self.processor(text=prompt, images=image, return_tensors="pt").to(self.device)
-            
-            with torch.no_grad():
-                generated_ids = self.model.generate(
-                    input_ids=inputs["input_ids"],
-                    pixel_values=inputs["pixel_values"],
-                    max_new_tokens=1024,
-                    num_beams=3,
-                    do_sample=False
-                )
+            generated_ids = self._run_generate(inputs)
             
             generated_text = self.processor.batch_decode(generated_ids, skip_special_tokens=True)[0]
             
@@ -63,19 +324,188 @@ class CaptionGenerator:
             
         except Exception as e:
             logging.exception(f"Error generating caption for {image_path}: {str(e)}")
-            return f"Error generating caption: {str(e)}"
+            return f"{CAPTION_ERROR_PREFIX}{str(e)}"
+
+    def _load_pixel_values(self, image_path: str) -> torch.Tensor:
+        return self.processor.image_processor(load_rgb_image(image_path, FLORENCE_INPUT_SIZE), return_tensors="pt")["pixel_values"]
+
+    def _prompt_input_ids(self, prompt: str) -> torch.Tensor:
+        # Florence-2 rewrites task tokens into full prompts, so tokenize via the processor once per task
+        if prompt not in self._prompt_ids:
+            dummy = Image.new("RGB", (64, 64))
+            self._prompt_ids[prompt] = self.processor(text=prompt, images=dummy, return_tensors="pt")["input_ids"]
+        return self._prompt_ids[prompt]
+
+    def _build_inputs(self, image_paths: List[str], prompt: str, executor: Optional[ThreadPoolExecutor] = None) -> Dict[str, torch.Tensor]:
+        if executor is not None:
+            pixel_values = torch.cat(list(executor.map(self._load_pixel_values, image_paths)))
+        else:
+            pixel_values = torch.cat([self._load_pixel_values(path) for path in image_paths])
+        input_ids = self._prompt_input_ids(prompt).repeat(len(image_paths), 1)
+        inputs = {"input_ids": input_ids, "pixel_values": pixel_values}
+        if self._copy_stream is not None:
+            # Pinned host memory is required for truly asynchronous H2D copies
+            inputs = {key: value.pin_memory() for key, value in inputs.items()}
+        return inputs
+
+    def _to_device(self, inputs: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+        if self._copy_stream is None:
+            return {
+                key: value.to(self.device, dtype=self.dtype if value.is_floating_point() else None)
+                for key, value in inputs.items()
+            }
+        
+        compute_stream = torch.cuda.current_stream()
+        with torch.cuda.stream(self._copy_stream):
+            device_inputs = {
+                key: value.to(self.device, non_blocking=True).to(self.dtype if value.is_floating_point() else value.dtype)
+                for key, value in inputs.items()
+            }
+        compute_stream.wait_stream(self._copy_stream)
+        for value in device_inputs.values():
+            # Tell the caching allocator these buffers are used on the compute stream
+            value.record_stream(compute_stream)
+        return device_inputs
+
+    def _prefetch_batches(self, image_paths: List[str], batch_size: int, prompt: str, depth: int = 2) -> Iterator[Tuple[List[str], Any, Optional[Exception]]]:
+        # Decode and preprocess upcoming batches on a producer thread while the
+        # model works on the current one; errors are handed to the consumer per batch
+        batches = queue.Queue(maxsize=depth)
+        stop = threading.Event()
+        
+        def put(item) -> bool:
+            # Give up once the consumer has stopped iterating instead of blocking on a full queue forever
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        
+        def produce():
+            # PIL decode and resize release the GIL, so a pool spreads them across cores
+            with ThreadPoolExecutor(max_workers=os.cpu_count()) as executor:
+                for start in range(0, len(image_paths), batch_size):
+                    if stop.is_set():
+                        return
+                    batch_paths = image_paths[start:start + batch_size]
+                    try:
+                        item = (batch_paths, self._build_inputs(batch_paths, prompt, executor), None)
+                    except Exception as e:
+                        item = (batch_paths, None, e)
+                    if not put(item):
+                        return
+            put(None)
+        
+        threading.Thread(target=produce, daemon=True).start()
+        try:
+            while True:
+                item = batches.get()
+                if item is None:
+                    break
+                yield item
+        finally:
+            stop.set()
+
+    def get_or_generate_caption(self, image_path: str, db: ImageDatabase, metadata: Optional[Dict[str, Any]] = None) -> str:
+        # Callers scanning many files can pass prefetched metadata to skip the lookup
+        if metadata is None:
+            metadata = db.get_image_metadata(image_path)
+        
+        cached = cached_caption(image_path, metadata)
+        if cached is not None:
+            logging.debug(f"Using cached caption for {image_path}")
+            return cached
+        
+        try:
+            content_hash = file_cache_key(image_path)
+        except OSError as e:
+            logging.warning(f"Cannot compute content hash for {image_path}: {str(e)}")
+            content_hash = None
+        
+        caption = self.generate_image_caption(image_path)
+        if not self.initialized or is_caption_failure(caption):
+            # Stored with a content hash, a failure would count as cached and never be retried
+            return caption
+        
+        if metadata is None:
+            logging.warning(f"No metadata found for {image_path}, using defaults")
+            metadata = {}
+        db.add_image(
+            image_path,
+            metadata.get('date', ''),
+            metadata.get('size', 0),
+            metadata.get('location', ''),
+            metadata.get('tags', ''),
+            caption,
+            content_hash
+        )
+        return caption
+
+    def iter_image_captions(self, image_paths: List[str], batch_size: int = 8) -> Iterator[Tuple[List[str], List[str]]]:
+        # Yields (paths, captions) per batch while the bounded prefetch queue decodes the next ones,
+        # so callers can store results without stalling image loading for the whole list
+        if not self.load_model():
+            logging.warning(f"Cannot generate captions for {len(image_paths)} images: Florence-2 model not loaded")
+            for start in range(0, len(image_paths), batch_size):
+                batch_paths = image_paths[start:start + batch_size]
+                yield batch_paths, [CAPTION_UNAVAILABLE] * len(batch_paths)
+            return
+        
+        for batch_paths, inputs, error in self._prefetch_batches(image_paths, batch_size, "<DETAILED_CAPTION>"):
+            try:
+                if error is not None:
+                    raise error
+                logging.debug(f"Generating captions for batch of {len(batch_paths)} images")
+                inputs = self._to_device(inputs)
+                
+                # No wall-clock cap: a caption cut off mid-sentence would be cached for good
+                generated_ids = self._run_generate(inputs)
+                
+                generated_texts = self.processor.batch_decode(generated_ids, skip_special_tokens=True)
+                captions = [text.strip() for text in generated_texts]
+                logging.debug(f"Generated {len(generated_texts)} captions in batch")
+                
+            except Exception as e:
+                # Fall back to one image at a time so a single bad file doesn't sink the batch
+                logging.exception(f"Error generating batch captions, retrying individually: {str(e)}")
+                captions = [self.generate_image_caption(path) for path in batch_paths]
+            yield batch_paths, captions
+
+    def _labels_from_detection(self, generated_text: str, image_size) -> list:
+        parsed = self.processor.post_process_generation(generated_text, task="<OD>", image_size=image_size)
+        labels = parsed.get("<OD>", {}).get("labels", [])
+        # Preserve first-seen order while dropping duplicate labels
+        return list(dict.fromkeys(label.strip().lower() for label in labels if label.strip()))
 
     def generate_tags(self, image_path: str) -> list:
-        if not self.initialized:
+        if not self.load_model():
             logging.warning(f"Cannot generate tags for {image_path}: Florence-2 model not loaded")
             return []
         
         try:
             logging.debug(f"Generating tags for {image_path}")
-            caption = self.generate_image_caption(image_path)
-            tags = [word.lower() for word in caption.split() if len(word) > 3]
+            inputs = self._to_device(self._build_inputs([image_path], "<OD>"))
+            generated_ids = self._run_generate(inputs)
+            # Keep special tokens: post_process_generation needs the <loc_*> markers
+            generated_text = self.processor.batch_decode(generated_ids, skip_special_tokens=False)[0]
+            tags = self._labels_from_detection(generated_text, image_size(image_path))
             logging.debug(f"Generated tags: {tags}")
             return tags
         except Exception as e:
             logging.exception(f"Error generating tags for {image_path}: {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+
+def get_caption_generator(**kwargs) -> CaptionGenerator:
+    # Florence-2-large is ~1.5GB; share one instance per process instead of reloading it
+    global _instance
+    with _instance_lock:
+        if _instance is None:
+            _instance = CaptionGenerator(**kwargs)
+        else:
+            mismatched = {key: value for key, value in kwargs.items() if getattr(_instance, key, value) != value}
+            if mismatched:
+                logging.warning(f"Ignoring caption generator options {mismatched}; the shared instance was created with different settings")
+        return _instance
@@ -1,17 +1,176 @@
 import sqlite3
 import logging
+import re
+import threading
+import itertools
+import uuid
+import weakref
 import pickle
-from typing import List, Dict, Optional, Any
+import numpy as np
+from typing import List, Dict, Optional, Any, Tuple, Iterable
+
+# Shared SQL text lets each connection's statement cache reuse the prepared statement
+METADATA_COLUMNS = ('file_path', 'date', 'size', 'location', 'tags', 'detailed_caption', 'content_hash')
+SELECT_METADATA = "SELECT file_path, date, size, location, tags, detailed_caption, content_hash FROM images"
+# Updates existing rows in place; a missing caption or content hash keeps the stored one
+UPSERT_IMAGE = '''
+    INSERT INTO images (file_path, date, size, location, tags, detailed_caption, content_hash)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(file_path) DO UPDATE SET
+        date = excluded.date,
+        size = excluded.size,
+        location = excluded.location,
+        tags = excluded.tags,
+        detailed_caption = COALESCE(excluded.detailed_caption, images.detailed_caption),
+        content_hash = COALESCE(excluded.content_hash, images.content_hash),
+        caption_embedding = CASE
+            WHEN excluded.detailed_caption IS NULL OR excluded.detailed_caption IS images.detailed_caption
+            THEN images.caption_embedding
+        END
+'''
+
+def encode_int8_vector(vector: Any) -> bytes:
+    # A float32 absmax scale followed by int8 components
+    vector = np.asarray(vector, dtype=np.float32).ravel()
+    scale = np.float32(max(float(np.abs(vector).max(initial=0.0)), 1e-6))
+    quantized = np.round(vector / scale * 127).astype(np.int8)
+    return scale.tobytes() + quantized.tobytes()
+
+
+def decode_int8_vectors(blobs: List[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    # One frombuffer over the joined blobs; returns the (N, D) int8 matrix and (N,) scales / 127
+    width = len(blobs[0])
+    raw = np.frombuffer(b"".join(blobs), dtype=np.uint8).reshape(len(blobs), width)
+    scales = raw[:, :4].copy().view(np.float32).ravel() / 127
+    return raw[:, 4:].view(np.int8), scales
+
+
+def encode_face_encoding(encoding: Any) -> bytes:
+    # 132 bytes for a 128-d face
+    return encode_int8_vector(encoding)
+
+
+def decode_face_encoding(blob: bytes) -> np.ndarray:
+    # Rows written before int8 storage hold pickled arrays
+    if blob[:1] == b'\x80' and blob[-1:] == b'.':
+        try:
+            return np.asarray(pickle.loads(blob), dtype=np.float32)
+        except Exception:
+            pass
+    scale = np.frombuffer(blob[:4], dtype=np.float32)[0]
+    return np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * (scale / 127)
+
+
+def decode_face_encodings(blobs: List[bytes]) -> np.ndarray:
+    if not blobs:
+        return np.empty((0, 128), dtype=np.float32)
+    width = len(blobs[0])
+    if any(len(blob) != width or blob[:1] == b'\x80' for blob in blobs):
+        return np.stack([decode_face_encoding(blob) for blob in blobs])
+    quantized, scales = decode_int8_vectors(blobs)
+    return quantized.astype(np.float32) * scales[:, None]
+
+
+def pairwise_face_distances(queries: np.ndarray, encodings: np.ndarray) -> np.ndarray:
+    # ||q - e||^2 = ||q||^2 - 2 q.e + ||e||^2, so the whole (M, N) matrix costs one matrix product
+    squared = (
+        np.einsum('ij,ij->i', queries, queries)[:, None]
+        - 2 * queries @ encodings.T
+        + np.einsum('ij,ij->i', encodings, encodings)[None, :]
+    )
+    return np.sqrt(np.maximum(squared, 0))
+
+
+class _ConnectionHandle:
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
 
 class ImageDatabase:
     def __init__(self, db_path: str):
         self.db_path = db_path
+        # Plain ":memory:" would give every thread its own empty database; name one shared in-memory cache instead.
+        # Shared-cache databases use table locks that busy_timeout doesn't retry, so prefer a file for concurrent writers
+        self._database = f"file:image-db-{uuid.uuid4().hex}?mode=memory&cache=shared" if db_path == ":memory:" else db_path
+        # An in-memory database vanishes with its last connection; this one keeps it alive until close()
+        self._memory_anchor = sqlite3.connect(self._database, uri=True, check_same_thread=False) if db_path == ":memory:" else None
+        # One long-lived connection per thread; sqlite3 connections can't be shared across threads safely
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # Bumped on every write that can change captions or their embeddings, so readers can cache them
+        self._caption_revisions = itertools.count(1)
+        self.caption_revision = 0
+        self.fts_enabled = False
         self._create_tables()
         logging.debug(f"ImageDatabase initialized with path {db_path}")
 
+    def _connection(self) -> sqlite3.Connection:
+        handle = getattr(self._local, 'handle', None)
+        if handle is None:
+            # IMMEDIATE takes the write lock when a transaction starts, so concurrent
+            # writer threads wait for the lock instead of failing mid-transaction upgrades
+            # check_same_thread is off only so close() can release other threads' connections
+            conn = sqlite3.connect(self._database, isolation_level="IMMEDIATE", check_same_thread=False,
+                                   uri=self._database.startswith("file:"))
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            conn.execute("PRAGMA cache_size=-65536")
+            conn.execute("PRAGMA busy_timeout=5000")
+            try:
+                # SQLite clamps this to its compile-time maximum; some platforms reject mmap entirely
+                conn.execute("PRAGMA mmap_size=10737418240")
+            except sqlite3.Error as e:
+                logging.warning(f"Memory-mapped I/O unavailable for {self.db_path}: {str(e)}")
+            # The handle lives only in this thread's local storage, so it is dropped when the thread exits;
+            # the finalizer then closes the connection instead of leaking it until close()
+            handle = _ConnectionHandle(conn)
+            weakref.finalize(handle, self._release_connection, conn)
+            self._local.handle = handle
+            with self._connections_lock:
+                self._connections.append(conn)
+            logging.debug(f"Opened database connection for thread {threading.current_thread().name}")
+        return handle.conn
+
+    def _release_connection(self, conn: sqlite3.Connection):
+        with self._connections_lock:
+            if conn not in self._connections:
+                return
+            self._connections.remove(conn)
+        try:
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            logging.warning(f"Error closing database connection for {self.db_path}: {str(e)}")
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for i, conn in enumerate(connections):
+            try:
+                conn.commit()
+                if i == len(connections) - 1:
+                    # Fold the WAL back into the database once the other readers are gone so it doesn't grow across runs
+                    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                conn.close()
+            except sqlite3.Error as e:
+                logging.warning(f"Error closing database connection for {self.db_path}: {str(e)}")
+        self._local = threading.local()
+        if self._memory_anchor is not None:
+            self._memory_anchor.close()
+            self._memory_anchor = None
+        logging.debug(f"Closed {len(connections)} connections to {self.db_path}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
     def _create_tables(self):
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 
                 # Images table
@@ -22,11 +181,23 @@ class ImageDatabase:
                         size INTEGER,
                         location TEXT,
                         tags TEXT,
-                        detailed_caption TEXT
+                        detailed_caption TEXT,
+                        content_hash TEXT,
+                        caption_embedding BLOB
                     )
                 ''')
                 
-                # Faces table
+                # Databases created before content hashing or embedding caching lack the columns
+                cursor.execute("PRAGMA table_info(images)")
+                columns = [row[1] for row in cursor.fetchall()]
+                if 'content_hash' not in columns:
+                    cursor.execute("ALTER TABLE images ADD COLUMN content_hash TEXT")
+                    logging.info("Added content_hash column to images table")
+                if 'caption_embedding' not in columns:
+                    cursor.execute("ALTER TABLE images ADD COLUMN caption_embedding BLOB")
+                    logging.info("Added caption_embedding column to images table")
+                
+                # Faces table; encoding holds a float32 scale + int8 components (see encode_face_encoding)
                 cursor.execute('''
                     CREATE TABLE IF NOT EXISTS faces (
                         file_path TEXT,
@@ -35,48 +206,174 @@ class ImageDatabase:
                         top INTEGER,
                         right INTEGER,
                         bottom INTEGER,
-                        left INTEGER
+                        left INTEGER,
+                        content_hash TEXT
+                    )
+                ''')
+                cursor.execute("PRAGMA table_info(faces)")
+                if 'content_hash' not in [row[1] for row in cursor.fetchall()]:
+                    cursor.execute("ALTER TABLE faces ADD COLUMN content_hash TEXT")
+                    logging.info("Added content_hash column to faces table")
+                
+                # File contents that have been through face detection, including those with no faces
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS face_scans (
+                        content_hash TEXT PRIMARY KEY
                     )
                 ''')
                 
+                # Content hash last scanned at each path, keyed by mtime+size so unchanged files are not re-hashed
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS face_scan_paths (
+                        file_path TEXT PRIMARY KEY,
+                        cache_key TEXT,
+                        content_hash TEXT
+                    )
+                ''')
+                
+                # Thumbnails live in their own table so image rewrites never touch the large blobs
+                cursor.execute('''
+                    CREATE TABLE IF NOT EXISTS thumbnails (
+                        file_path TEXT PRIMARY KEY,
+                        cache_key TEXT,
+                        thumb BLOB
+                    )
+                ''')
+                
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_faces_file ON faces(file_path)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_faces_name ON faces(name)")
+                cursor.execute("CREATE INDEX IF NOT EXISTS idx_faces_hash ON faces(content_hash)")
+                
                 conn.commit()
                 logging.debug("Database tables created or verified")
         except sqlite3.Error as e:
             logging.exception(f"Error creating tables: {str(e)}")
             raise
+        
+        self._create_fts()
 
-    def add_image(self, file_path: str, date: str, size: int, location: str, tags: str, detailed_caption: str):
+    def _create_fts(self):
+        # Full-text index over tags and captions; optional because not every SQLite build ships FTS5
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images_fts'")
+                exists = cursor.fetchone() is not None
+                
+                cursor.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS images_fts USING fts5(
+                        file_path UNINDEXED, tags, detailed_caption,
+                        content='images', content_rowid='rowid'
+                    )
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS images_fts_insert AFTER INSERT ON images BEGIN
+                        INSERT INTO images_fts(rowid, file_path, tags, detailed_caption)
+                        VALUES (new.rowid, new.file_path, new.tags, new.detailed_caption);
+                    END
+                ''')
+                cursor.execute('''
+                    CREATE TRIGGER IF NOT EXISTS images_fts_delete AFTER DELETE ON images BEGIN
+                        INSERT INTO images_fts(images_fts, rowid, file_path, tags, detailed_caption)
+                        VALUES ('delete', old.rowid, old.file_path, old.tags, old.detailed_caption);
+                    END
+                ''')
+                # Only caption or tag changes touch the index; location and embedding updates skip it.
+                # Dropped first so databases created with the older any-column trigger pick this one up
+                cursor.execute("DROP TRIGGER IF EXISTS images_fts_update")
                 cursor.execute('''
-                    INSERT OR REPLACE INTO images (file_path, date, size, location, tags, detailed_caption)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (file_path, date, size, location, tags, detailed_caption))
+                    CREATE TRIGGER images_fts_update AFTER UPDATE OF tags, detailed_caption ON images
+                    WHEN old.tags IS NOT new.tags OR old.detailed_caption IS NOT new.detailed_caption BEGIN
+                        INSERT INTO images_fts(images_fts, rowid, file_path, tags, detailed_caption)
+                        VALUES ('delete', old.rowid, old.file_path, old.tags, old.detailed_caption);
+                        INSERT INTO images_fts(rowid, file_path, tags, detailed_caption)
+                        VALUES (new.rowid, new.file_path, new.tags, new.detailed_caption);
+                    END
+                ''')
+                
+                if not exists:
+                    # Index rows written before the FTS table existed
+                    cursor.execute("INSERT INTO images_fts(images_fts) VALUES ('rebuild')")
+                    logging.info("Built full-text index for images")
+                
                 conn.commit()
+                self.fts_enabled = True
+        except sqlite3.Error as e:
+            logging.warning(f"FTS5 unavailable, caption search falls back to LIKE: {str(e)}")
+            self.fts_enabled = False
+
+    def search_captions(self, query: str) -> List[str]:
+        terms = re.findall(r'\w+', query)
+        if not terms:
+            return []
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                if self.fts_enabled:
+                    # Quote each term so user input can't inject FTS5 query syntax
+                    match = " ".join(f'"{term}"' for term in terms)
+                    cursor.execute('''
+                        SELECT file_path FROM images_fts WHERE images_fts MATCH ? ORDER BY rank
+                    ''', (match,))
+                else:
+                    conditions = " AND ".join("(tags LIKE ? OR detailed_caption LIKE ?)" for _ in terms)
+                    params = [p for term in terms for p in (f"%{term}%", f"%{term}%")]
+                    cursor.execute(f"SELECT file_path FROM images WHERE {conditions}", params)
+                file_paths = [row[0] for row in cursor.fetchall()]
+                logging.debug(f"Caption search for '{query}' matched {len(file_paths)} images")
+                return file_paths
+        except sqlite3.Error as e:
+            logging.exception(f"Error searching captions for '{query}': {str(e)}")
+            return []
+
+    def add_image(self, file_path: str, date: str, size: int, location: str, tags: str, detailed_caption: str, content_hash: Optional[str] = None):
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute(UPSERT_IMAGE, (file_path, date, size, location, tags, detailed_caption, content_hash))
+                conn.commit()
+                self.caption_revision = next(self._caption_revisions)
                 logging.debug(f"Added/updated image metadata for {file_path}")
         except sqlite3.Error as e:
             logging.exception(f"Error adding image {file_path}: {str(e)}")
             raise
 
+    def add_images_bulk(self, rows: List[Tuple]):
+        # rows: (file_path, date, size, location, tags, detailed_caption, content_hash)
+        if not rows:
+            return
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany(UPSERT_IMAGE, rows)
+                self.caption_revision = next(self._caption_revisions)
+                logging.debug(f"Added/updated image metadata for {len(rows)} images")
+        except sqlite3.Error as e:
+            logging.exception(f"Error adding {len(rows)} images: {str(e)}")
+            raise
+
+    def update_locations(self, rows: List[Tuple[str, str]]):
+        # rows: (location, file_path)
+        if not rows:
+            return
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    UPDATE images SET location = ? WHERE file_path = ?
+                ''', rows)
+                logging.debug(f"Updated locations for {len(rows)} images")
+        except sqlite3.Error as e:
+            logging.exception(f"Error updating locations for {len(rows)} images: {str(e)}")
+
     def get_image_metadata(self, file_path: str) -> Optional[Dict[str, Any]]:
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT file_path, date, size, location, tags, detailed_caption
-                    FROM images WHERE file_path = ?
-                ''', (file_path,))
+                cursor.execute(SELECT_METADATA + " WHERE file_path = ?", (file_path,))
                 result = cursor.fetchone()
                 if result:
-                    return {
-                        'file_path': result[0],
-                        'date': result[1],
-                        'size': result[2],
-                        'location': result[3],
-                        'tags': result[4],
-                        'detailed_caption': result[5]
-                    }
+                    return dict(zip(METADATA_COLUMNS, result))
                 logging.debug(f"No metadata found for {file_path}")
                 return None
         except sqlite3.Error as e:
@@ -85,65 +382,170 @@ class ImageDatabase:
 
     def get_all_metadata(self) -> List[Dict[str, Any]]:
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT file_path, date, size, location, tags, detailed_caption
-                    FROM images
-                ''')
-                results = cursor.fetchall()
-                metadata = [
-                    {
-                        'file_path': row[0],
-                        'date': row[1],
-                        'size': row[2],
-                        'location': row[3],
-                        'tags': row[4],
-                        'detailed_caption': row[5]
-                    }
-                    for row in results
-                ]
+                cursor.execute(SELECT_METADATA)
+                metadata = [dict(zip(METADATA_COLUMNS, row)) for row in cursor.fetchall()]
                 logging.debug(f"Retrieved metadata for {len(metadata)} images")
                 return metadata
         except sqlite3.Error as e:
             logging.exception(f"Error retrieving all metadata: {str(e)}")
             return []
 
-    def add_face(self, file_path: str, encoding: Any, name: Optional[str], top: int, right: int, bottom: int, left: int):
+    def get_caption_embeddings(self) -> List[Tuple[str, str, Optional[bytes]]]:
+        # (file_path, caption, embedding) for every captioned image; embedding is NULL until computed
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
-                encoding_blob = pickle.dumps(encoding)
                 cursor.execute('''
-                    INSERT INTO faces (file_path, encoding, name, top, right, bottom, left)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                ''', (file_path, encoding_blob, name, top, right, bottom, left))
-                conn.commit()
-                logging.debug(f"Added face for {file_path} at ({left}, {top}, {right}, {bottom})")
+                    SELECT file_path, detailed_caption, caption_embedding FROM images
+                    WHERE detailed_caption IS NOT NULL AND detailed_caption != ''
+                ''')
+                rows = cursor.fetchall()
+                logging.debug(f"Retrieved caption embeddings for {len(rows)} images")
+                return rows
+        except sqlite3.Error as e:
+            logging.exception(f"Error retrieving caption embeddings: {str(e)}")
+            return []
+
+    def update_caption_embeddings(self, rows: List[Tuple[bytes, str]]):
+        # rows are (embedding, file_path)
+        if not rows:
+            return
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    UPDATE images SET caption_embedding = ? WHERE file_path = ?
+                ''', rows)
+                self.caption_revision = next(self._caption_revisions)
+                logging.debug(f"Stored caption embeddings for {len(rows)} images")
+        except sqlite3.Error as e:
+            logging.exception(f"Error storing caption embeddings for {len(rows)} images: {str(e)}")
+
+    def get_thumbnail(self, file_path: str, cache_key: str) -> Optional[bytes]:
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT thumb FROM thumbnails WHERE file_path = ? AND cache_key = ?
+                ''', (file_path, cache_key))
+                result = cursor.fetchone()
+                return result[0] if result else None
+        except sqlite3.Error as e:
+            logging.exception(f"Error retrieving thumbnail for {file_path}: {str(e)}")
+            return None
+
+    def save_thumbnail(self, file_path: str, cache_key: str, thumb: bytes):
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO thumbnails (file_path, cache_key, thumb)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(file_path) DO UPDATE SET cache_key = excluded.cache_key, thumb = excluded.thumb
+                ''', (file_path, cache_key, thumb))
+                logging.debug(f"Cached {len(thumb)}-byte thumbnail for {file_path}")
         except sqlite3.Error as e:
-            logging.exception(f"Error adding face for {file_path}: {str(e)}")
+            logging.exception(f"Error caching thumbnail for {file_path}: {str(e)}")
+
+    def add_face(self, file_path: str, encoding: Any, name: Optional[str], top: int, right: int, bottom: int, left: int):
+        self.add_faces_bulk([(file_path, encoding, name, top, right, bottom, left)])
+
+    def add_faces_bulk(self, rows: Iterable[Tuple], content_hash: Optional[str] = None):
+        # rows: (file_path, encoding, name, top, right, bottom, left); content_hash marks the file contents as scanned
+        rows = [(row[0], encode_face_encoding(row[1]), *row[2:], content_hash) for row in rows]
+        if not rows and content_hash is None:
+            return
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT INTO faces (file_path, encoding, name, top, right, bottom, left, content_hash)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', rows)
+                if content_hash is not None:
+                    cursor.execute('''
+                        INSERT OR IGNORE INTO face_scans (content_hash) VALUES (?)
+                    ''', (content_hash,))
+                logging.debug(f"Added {len(rows)} faces")
+        except sqlite3.Error as e:
+            logging.exception(f"Error adding {len(rows)} faces: {str(e)}")
             raise
 
+    def get_face_scan_hash(self, file_path: str, cache_key: str) -> Optional[str]:
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT content_hash FROM face_scan_paths WHERE file_path = ? AND cache_key = ?
+                ''', (file_path, cache_key))
+                result = cursor.fetchone()
+                return result[0] if result else None
+        except sqlite3.Error as e:
+            logging.exception(f"Error retrieving face scan for {file_path}: {str(e)}")
+            return None
+
+    def save_face_scan_hash(self, file_path: str, cache_key: str, content_hash: str):
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO face_scan_paths (file_path, cache_key, content_hash)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(file_path) DO UPDATE SET cache_key = excluded.cache_key, content_hash = excluded.content_hash
+                ''', (file_path, cache_key, content_hash))
+        except sqlite3.Error as e:
+            logging.exception(f"Error saving face scan for {file_path}: {str(e)}")
+
+    def reuse_faces(self, file_path: str, content_hash: str) -> bool:
+        # True if these contents were already scanned; faces found under another path are copied to file_path
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT 1 FROM face_scans WHERE content_hash = ?", (content_hash,))
+                if cursor.fetchone() is None:
+                    return False
+                cursor.execute('''
+                    SELECT 1 FROM faces WHERE file_path = ? AND content_hash = ? LIMIT 1
+                ''', (file_path, content_hash))
+                if cursor.fetchone() is not None:
+                    return True
+                cursor.execute("DELETE FROM faces WHERE file_path = ?", (file_path,))
+                cursor.execute('''
+                    INSERT INTO faces (file_path, encoding, name, top, right, bottom, left, content_hash)
+                    SELECT ?, encoding, name, top, right, bottom, left, content_hash FROM faces
+                    WHERE content_hash = ? AND file_path = (
+                        SELECT file_path FROM faces WHERE content_hash = ? LIMIT 1
+                    )
+                ''', (file_path, content_hash, content_hash))
+                logging.debug(f"Reused {cursor.rowcount} faces for {file_path}")
+                return True
+        except sqlite3.Error as e:
+            logging.exception(f"Error reusing faces for {file_path}: {str(e)}")
+            return False
+
     def get_faces(self, file_path: str) -> List[Dict[str, Any]]:
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     SELECT file_path, encoding, name, top, right, bottom, left
                     FROM faces WHERE file_path = ?
                 ''', (file_path,))
                 results = cursor.fetchall()
+                encodings = decode_face_encodings([row[1] for row in results])
                 faces = [
                     {
                         'file_path': row[0],
-                        'encoding': pickle.loads(row[1]),
+                        'encoding': encodings[i],
                         'name': row[2],
                         'top': row[3],
                         'right': row[4],
                         'bottom': row[5],
                         'left': row[6]
                     }
-                    for row in results
+                    for i, row in enumerate(results)
                 ]
                 logging.debug(f"Retrieved {len(faces)} faces for {file_path}")
                 return faces
@@ -151,15 +553,94 @@ class ImageDatabase:
             logging.exception(f"Error retrieving faces for {file_path}: {str(e)}")
             return []
 
+    def match_faces(self, query_encodings: Any, threshold: float = 0.6) -> List[List[Dict[str, Any]]]:
+        # For each query face, every stored face within threshold, nearest first
+        queries = np.atleast_2d(np.asarray(query_encodings, dtype=np.float32))
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT rowid, encoding, file_path, name FROM faces
+                ''')
+                results = cursor.fetchall()
+            if not results or not len(queries):
+                return [[] for _ in queries]
+            encodings = decode_face_encodings([row[1] for row in results])
+            distances = pairwise_face_distances(queries, encodings)
+            matches = []
+            for row_distances in distances:
+                hits = np.flatnonzero(row_distances <= threshold)
+                hits = hits[np.argsort(row_distances[hits])]
+                matches.append([
+                    {'rowid': results[i][0], 'file_path': results[i][2], 'name': results[i][3], 'distance': float(row_distances[i])}
+                    for i in hits
+                ])
+            logging.debug(f"Matched {len(queries)} faces against {len(results)} stored faces")
+            return matches
+        except (sqlite3.Error, ValueError) as e:
+            logging.exception(f"Error matching {len(queries)} faces: {str(e)}")
+            return [[] for _ in queries]
+
+    def get_face_names(self) -> List[str]:
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT DISTINCT name FROM faces WHERE name IS NOT NULL AND name != ''
+                ''')
+                return [row[0] for row in cursor.fetchall()]
+        except sqlite3.Error as e:
+            logging.exception(f"Error retrieving face names: {str(e)}")
+            return []
+
+    def get_person_file_paths(self, name: str, threshold: float = 0.6) -> List[str]:
+        # Images with a face tagged as name, plus untagged faces within threshold of any tagged one;
+        # every stored face is compared against the person's faces in a single matrix product
+        try:
+            with self._connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT encoding, file_path, name FROM faces
+                ''')
+                results = cursor.fetchall()
+            named = np.array([bool(row[2]) and row[2].casefold() == name.casefold() for row in results], dtype=bool)
+            if not named.any():
+                return []
+            matched = named
+            untagged = np.array([not row[2] for row in results], dtype=bool)
+            if untagged.any():
+                try:
+                    encodings = decode_face_encodings([row[0] for row in results])
+                    nearest = pairwise_face_distances(encodings[named], encodings).min(axis=0)
+                    matched = named | (untagged & (nearest <= threshold))
+                except ValueError as e:
+                    logging.warning(f"Matching untagged faces to {name} failed; using tagged faces only: {str(e)}")
+            file_paths = list(dict.fromkeys(results[i][1] for i in np.flatnonzero(matched)))
+            logging.debug(f"Found {len(file_paths)} images of {name}")
+            return file_paths
+        except sqlite3.Error as e:
+            logging.exception(f"Error retrieving images of {name}: {str(e)}")
+            return []
+
     def update_face_name(self, file_path: str, encoding: Any, name: str):
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
-                encoding_blob = pickle.dumps(encoding)
+                # Match the closest face in this image rather than comparing blobs byte-for-byte,
+                # which silently misses after any float round-trip
+                cursor.execute('''
+                    SELECT rowid, encoding FROM faces WHERE file_path = ?
+                ''', (file_path,))
+                results = cursor.fetchall()
+                if not results:
+                    logging.warning(f"No faces stored for {file_path}; cannot set name {name}")
+                    return
+                encodings = decode_face_encodings([row[1] for row in results])
+                distances = np.linalg.norm(encodings - np.asarray(encoding, dtype=np.float32), axis=1)
+                rowid = results[int(np.argmin(distances))][0]
                 cursor.execute('''
-                    UPDATE faces SET name = ?
-                    WHERE file_path = ? AND encoding = ?
-                ''', (name, file_path, encoding_blob))
+                    UPDATE faces SET name = ? WHERE rowid = ?
+                ''', (name, rowid))
                 conn.commit()
                 logging.debug(f"Updated face name to {name} for {file_path}")
         except sqlite3.Error as e:
@@ -168,7 +649,7 @@ class ImageDatabase:
 
     def clear_faces(self, file_path: str):
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connection() as conn:
                 cursor = conn.cursor()
                 cursor.execute('''
                     DELETE FROM faces WHERE file_path = ?
@@ -0,0 +1,83 @@
+import os
+import logging
+import threading
+import cv2
+import numpy as np
+from typing import List, Tuple
+
+# OpenCV's ResNet-10 SSD face detector, downloaded into the project root (see README)
+FACE_MODEL_DIR = os.environ.get("SPG_FACE_MODEL_DIR", os.path.dirname(os.path.abspath(__file__)))
+FACE_PROTOTXT = "deploy.prototxt"
+FACE_CAFFEMODEL = "res10_300x300_ssd_iter_140000.caffemodel"
+SSD_INPUT_SIZE = (300, 300)
+SSD_MEAN = (104.0, 177.0, 123.0)
+
+_face_net = None
+_face_net_loaded = False
+_face_net_lock = threading.Lock()
+
+
+def _configure_backend(net):
+    # Prefer CUDA FP16, then OpenVINO, then OpenCV's own CPU kernels; only backends this build supports are tried
+    try:
+        available = set(cv2.dnn.getAvailableBackends())
+        has_cuda = hasattr(cv2, "cuda") and cv2.cuda.getCudaEnabledDeviceCount() > 0
+        if has_cuda and (cv2.dnn.DNN_BACKEND_CUDA, cv2.dnn.DNN_TARGET_CUDA_FP16) in available:
+            net.setPreferableBackend(cv2.dnn.DNN_BACKEND_CUDA)
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CUDA_FP16)
+            logging.info("SSD face detector running on CUDA (FP16)")
+        elif (cv2.dnn.DNN_BACKEND_INFERENCE_ENGINE, cv2.dnn.DNN_TARGET_CPU) in available:
+            net.setPreferableBackend(cv2.dnn.DNN_BACKEND_INFERENCE_ENGINE)
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+            logging.info("SSD face detector running on OpenVINO")
+        else:
+            net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+    except (cv2.error, AttributeError) as e:
+        logging.debug(f"Using default OpenCV DNN backend for face detection: {str(e)}")
+
+
+def _get_face_net():
+    global _face_net, _face_net_loaded
+    with _face_net_lock:
+        if not _face_net_loaded:
+            _face_net_loaded = True
+            prototxt = os.path.join(FACE_MODEL_DIR, FACE_PROTOTXT)
+            caffemodel = os.path.join(FACE_MODEL_DIR, FACE_CAFFEMODEL)
+            if os.path.exists(prototxt) and os.path.exists(caffemodel):
+                try:
+                    _face_net = cv2.dnn.readNetFromCaffe(prototxt, caffemodel)
+                    _configure_backend(_face_net)
+                    logging.info(f"Loaded SSD face detector from {FACE_MODEL_DIR}")
+                except cv2.error as e:
+                    logging.warning(f"Could not load SSD face detector, using HOG: {str(e)}")
+            else:
+                logging.info(f"SSD face detector not found in {FACE_MODEL_DIR}; using HOG")
+        return _face_net
+
+
+def detect_faces(images_rgb: List[np.ndarray], confidence: float = 0.5, batch_size: int = 16) -> List[List[Tuple[int, int, int, int]]]:
+    # Takes RGB arrays so callers can pass the buffer they already hand to face_recognition;
+    # returns (top, right, bottom, left) boxes per image, the order face_recognition expects
+    net = _get_face_net()
+    if net is None:
+        import face_recognition
+        return [face_recognition.face_locations(image, model='hog') for image in images_rgb]
+
+    locations = []
+    for start in range(0, len(images_rgb), batch_size):
+        batch = images_rgb[start:start + batch_size]
+        # One forward pass for the whole batch; swapRB reorders channels while building the blob,
+        # so no BGR copy of each image is made (SSD_MEAN stays in the network's BGR order)
+        blob = cv2.dnn.blobFromImages(batch, 1.0, SSD_INPUT_SIZE, SSD_MEAN, swapRB=True, crop=False)
+        net.setInput(blob)
+        detections = net.forward()[0, 0]
+        boxes = [[] for _ in batch]
+        for image_id, _, score, x1, y1, x2, y2 in detections[detections[:, 2] > confidence]:
+            height, width = batch[int(image_id)].shape[:2]
+            left, top = max(int(x1 * width), 0), max(int(y1 * height), 0)
+            right, bottom = min(int(x2 * width), width - 1), min(int(y2 * height), height - 1)
+            if right > left and bottom > top:
+                boxes[int(image_id)].append((top, right, bottom, left))
+        locations.extend(boxes)
+    return locations
@@ -1,7 +1,7 @@
 import tkinter as tk
 from ui_manager import UIManager
 from photo_manager import PhotoManager
-from caption_generator import CaptionGenerator
+from caption_generator import get_caption_generator
 from database import ImageDatabase
 import logging
 import threading
@@ -39,25 +39,30 @@ def main():
     
     # Queue for model loading status
     model_queue = queue.Queue()
+    models_handled = threading.Event()
     
     def load_models():
         try:
             logging.info("Starting background model loading")
-            caption_generator = CaptionGenerator()
+            caption_generator = get_caption_generator()
+            # The search model loads on first search, Florence-2 on first caption
             photo_manager = PhotoManager(caption_generator, db)
-            photo_manager.load_model()
             model_queue.put((photo_manager, caption_generator))
             logging.info("Background model loading completed")
         except Exception as e:
             logging.exception(f"Error loading models: {str(e)}")
             model_queue.put(None)
+        try:
+            # Wake the Tk loop once instead of having it poll the queue
+            root.event_generate("<<ModelsLoaded>>", when="tail")
+        except (tk.TclError, RuntimeError) as e:
+            # Non-threaded Tcl or a mainloop that isn't running yet; the main thread's fallback check picks it up
+            logging.warning(f"Could not signal model loading completion: {str(e)}")
     
-    # Start model loading in background
-    threading.Thread(target=load_models, daemon=True).start()
-    
-    def check_model_loading():
+    def on_models_loaded(event=None):
         try:
             result = model_queue.get_nowait()
+            models_handled.set()
             if result:
                 photo_manager, caption_generator = result
                 ui_manager.photo_manager = photo_manager
@@ -67,15 +72,32 @@ def main():
                 ui_manager.sort_menu.config(state='normal')
                 status_var.set("Ready")
                 logging.info("Models loaded, UI enabled")
+                # Florence-2 loads lazily; warm it in the background now that the UI is responsive
+                threading.Thread(target=caption_generator.load_model, daemon=True).start()
             else:
                 status_var.set("Error loading models")
                 logging.error("Model loading failed")
         except queue.Empty:
-            root.after(100, check_model_loading)
+            logging.debug("Models loaded event received with nothing queued")
     
-    root.after(100, check_model_loading)
+    def check_models_loaded():
+        # Runs on the Tk thread, so it works even when the loader thread can't generate events
+        if models_handled.is_set():
+            return
+        if not model_queue.empty():
+            on_models_loaded()
+        else:
+            root.after(500, check_models_loaded)
+    
+    # Bind before starting the loader so the event can't arrive unhandled
+    root.bind("<<ModelsLoaded>>", on_models_loaded)
+    threading.Thread(target=load_models, daemon=True).start()
+    root.after(500, check_models_loaded)
     
-    root.mainloop()
+    try:
+        root.mainloop()
+    finally:
+        db.close()
     logging.info("SmartPhotoGallery closed")
 
 if __name__ == "__main__":
@@ -1,35 +1,176 @@
 import os
-import cv2
+import re
+import platform
 import numpy as np
 import logging
 from datetime import datetime
 from PIL import Image
-import exifread
-from typing import List, Tuple, Optional
-from caption_generator import CaptionGenerator
-from database import ImageDatabase
+from typing import List, Tuple, Optional, Iterator, Any, Dict
+from caption_generator import CaptionGenerator, is_caption_failure
+from database import ImageDatabase, encode_int8_vector, decode_int8_vectors
+from utils import file_cache_key, cache_key_from_stat
 import threading
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
+from functools import lru_cache
+
+# Case-insensitive suffix match in re's C engine, so the walk builds no lowercased name per entry
+IMAGE_NAME_PATTERN = re.compile(r'.\.(?:jpe?g|png)$', re.IGNORECASE)
+
+# "with <name>" in a search names a person tagged on faces. The name may span several words and is
+# captured in a lookahead, so a later "with" in the same query is still tried
+PERSON_QUERY_PATTERN = re.compile(r'\bwith\s+(?=([^\W\d_][\w\'-]*(?:\s+[^\W\d_][\w\'-]*)*))', re.IGNORECASE)
+QUERY_WORD_PATTERN = re.compile(r'\S+')
+
+# EXIF GPS IFD pointer and its latitude/longitude tags
+GPS_IFD_TAG = 0x8825
+GPS_LATITUDE_REF, GPS_LATITUDE, GPS_LONGITUDE_REF, GPS_LONGITUDE = 1, 2, 3, 4
+
+NLP_MODEL_ID = 'all-MiniLM-L6-v2'
+# Large enough to keep a GPU busy when backfilling a whole library's embeddings
+NLP_BATCH_SIZE = 64
+# Quantized exports published alongside the model, by CPU architecture
+ONNX_NLP_MODEL_FILES = {
+    'x86_64': 'onnx/model_quint8_avx2.onnx',
+    'amd64': 'onnx/model_quint8_avx2.onnx',
+    'arm64': 'onnx/model_qint8_arm64.onnx',
+    'aarch64': 'onnx/model_qint8_arm64.onnx',
+}
+# Below this many files, a thread pool costs more than it saves
+LOCATION_POOL_MIN_FILES = 64
+LOCATION_WORKERS = 8
+
+
+def scan_images(folder: str) -> Iterator[Tuple[str, os.stat_result]]:
+    # Iterative os.scandir walk; DirEntry.stat() reuses the directory read on most platforms
+    pending = [folder]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                        elif IMAGE_NAME_PATTERN.search(entry.name) and entry.is_file():
+                            yield entry.path, entry.stat()
+                    except OSError as e:
+                        logging.warning(f"Skipping {entry.path}: {str(e)}")
+        except OSError as e:
+            logging.warning(f"Cannot scan directory {current}: {str(e)}")
+
+
+def read_photo_location(file_path: str) -> str:
+    try:
+        # Pillow reads only the EXIF segment and doesn't decode pixel data
+        with Image.open(file_path) as img:
+            gps = img.getexif().get_ifd(GPS_IFD_TAG)
+        latitude = gps.get(GPS_LATITUDE)
+        longitude = gps.get(GPS_LONGITUDE)
+        if not latitude or not longitude:
+            return "Unknown"
+        
+        def to_degrees(value) -> float:
+            d, m, s = (float(x) for x in value)
+            return d + m / 60 + s / 3600
+        
+        lat = to_degrees(latitude)
+        lon = to_degrees(longitude)
+        if gps.get(GPS_LATITUDE_REF, 'N') == 'S':
+            lat = -lat
+        if gps.get(GPS_LONGITUDE_REF, 'E') == 'W':
+            lon = -lon
+        return f"{lat:.6f}, {lon:.6f}"
+    except Exception as e:
+        logging.debug(f"No GPS location for {file_path}: {str(e)}")
+        return "Unknown"
+
+
+_nlp_model = None
+_nlp_model_loaded = False
+_nlp_model_lock = threading.Lock()
+
+
+def _load_onnx_nlp_model(sentence_transformer):
+    # On CPU the int8-quantized ONNX export of MiniLM runs on ONNX Runtime's VNNI/dot-product kernels
+    try:
+        import torch
+        if torch.cuda.is_available():
+            return None
+        import onnxruntime  # noqa: F401 - only checks the backend is installed
+        file_name = ONNX_NLP_MODEL_FILES.get(platform.machine().lower())
+        if file_name is None:
+            return None
+        model = sentence_transformer(NLP_MODEL_ID, backend="onnx", model_kwargs={"file_name": file_name})
+        logging.info(f"Using ONNX Runtime for {NLP_MODEL_ID} ({file_name})")
+        return model
+    except Exception as e:
+        logging.info(f"ONNX Runtime backend unavailable for {NLP_MODEL_ID}, using PyTorch: {str(e)}")
+        return None
+
+
+def _load_torch_nlp_model(sentence_transformer):
+    import torch
+    if torch.cuda.is_available():
+        device = "cuda"
+    elif torch.backends.mps.is_available():
+        device = "mps"
+    else:
+        device = "cpu"
+    model = sentence_transformer(NLP_MODEL_ID, device=device)
+    if device == "cuda":
+        # fp16 halves weight memory and uses tensor cores; embeddings are quantized to int8 anyway
+        model.half()
+    logging.info(f"Using PyTorch on {device} for {NLP_MODEL_ID}")
+    return model
+
+
+def get_nlp_model():
+    # SentenceTransformer pulls in the whole torch stack; load it once per process, on the first search that needs it
+    global _nlp_model, _nlp_model_loaded
+    with _nlp_model_lock:
+        if not _nlp_model_loaded:
+            _nlp_model_loaded = True
+            try:
+                logging.info("Loading SentenceTransformer model")
+                from sentence_transformers import SentenceTransformer
+                _nlp_model = _load_onnx_nlp_model(SentenceTransformer) or _load_torch_nlp_model(SentenceTransformer)
+                logging.info("SentenceTransformer model loaded successfully")
+            except Exception as e:
+                logging.exception(f"Error loading NLP model: {str(e)}")
+                _nlp_model = None
+        return _nlp_model
+
 
 class PhotoManager:
     def __init__(self, caption_generator: CaptionGenerator, db: ImageDatabase):
         self.photos: List[Tuple[str, datetime, int, str, str]] = []
+        # Column arrays of sort keys kept in the same order as self.photos
+        self._sort_keys = None
+        self._tag_index = {}
+        self._photos_by_path = {}
+        # Held while self.photos is reordered or its locations are filled in from the background thread
+        self._photos_lock = threading.Lock()
         self.caption_generator = caption_generator
         self.db = db
         self.current_sort = "Date"
         self.nlp_model = None
+        self._nlp_lock = threading.Lock()
+        self._nlp_load_attempted = False
+        # (caption_revision, paths, int8 embeddings, scales) from the last search
+        self._embedding_cache = None
+        # Per-instance LRU of query embeddings; repeated searches skip transformer inference
+        self._encode_query = lru_cache(maxsize=128)(self._encode_query_uncached)
         self.caption_thread = None
         logging.debug("PhotoManager initialized")
 
-    def load_model(self):
-        try:
-            logging.info("Loading SentenceTransformer model")
-            from sentence_transformers import SentenceTransformer
-            self.nlp_model = SentenceTransformer('all-MiniLM-L6-v2')
-            logging.info("SentenceTransformer model loaded successfully")
-        except Exception as e:
-            logging.exception(f"Error loading NLP model: {str(e)}")
-            self.nlp_model = None
+    def load_model(self) -> bool:
+        with self._nlp_lock:
+            if self.nlp_model is not None or self._nlp_load_attempted:
+                return self.nlp_model is not None
+            self._nlp_load_attempted = True
+            self.nlp_model = get_nlp_model()
+            return self.nlp_model is not None
 
     def load_photos(self, folder: str, status_var: Optional[tk.StringVar] = None):
         try:
@@ -42,41 +183,33 @@ class PhotoManager:
                 raise PermissionError(f"No read permissions for folder: {folder}")
             
             # Get existing metadata
-            try:
-                existing_metadata = {m["file_path"]: m for m in self.db.get_all_metadata()}
-            except AttributeError:
-                logging.warning("Database does not support get_all_metadata; querying individually")
-                existing_metadata = {}
-                for root, _, files in os.walk(folder):
-                    for file in files:
-                        if file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                            file_path = os.path.join(root, file)
-                            metadata = self.db.get_image_metadata(file_path)
-                            if metadata:
-                                existing_metadata[file_path] = metadata
+            existing_metadata = {m["file_path"]: m for m in self.db.get_all_metadata()}
             
             photos = []
-            for root, _, files in os.walk(folder):
-                for file in files:
-                    if file.lower().endswith(('.jpg', '.jpeg', '.png')):
-                        file_path = os.path.join(root, file)
-                        try:
-                            stat = os.stat(file_path)
-                            date = datetime.fromtimestamp(stat.st_mtime)
-                            size = stat.st_size
-                            
-                            if file_path in existing_metadata:
-                                metadata = existing_metadata[file_path]
-                                location = metadata.get("location", "Unknown")
-                                tags = metadata.get("tags", "")
-                            else:
-                                location = "Unknown"
-                                tags = ""
-                            
-                            photos.append((file_path, date, size, location, tags))
-                        except Exception as e:
-                            logging.exception(f"Error processing file {file_path}: {str(e)}")
-                            continue
+            mtimes_ns = []
+            # Change keys from the scan's stat, so caption caching needs no second stat per file
+            content_keys = {}
+            # Paths whose location is read on the background thread after the grid is shown
+            missing_locations = []
+            for file_path, stat in scan_images(folder):
+                try:
+                    date = datetime.fromtimestamp(stat.st_mtime)
+                    size = stat.st_size
+                    content_key = cache_key_from_stat(stat)
+                
+                    metadata = existing_metadata.get(file_path)
+                    tags = metadata.get("tags", "") if metadata else ""
+                    location = metadata.get("location") if metadata else None
+                    # A stored location is trusted if it was found or the file is unchanged since parsing
+                    if not location or (location == "Unknown" and metadata.get("content_hash") != content_key):
+                        missing_locations.append(file_path)
+                
+                    photos.append((file_path, date, size, location, tags))
+                    mtimes_ns.append(stat.st_mtime_ns)
+                    content_keys[file_path] = content_key
+                except Exception as e:
+                    logging.exception(f"Error processing file {file_path}: {str(e)}")
+                    continue
             
             if not photos:
                 if status_var:
@@ -84,14 +217,18 @@ class PhotoManager:
                 raise ValueError("No valid images found in folder")
             
             self.photos = photos
+            self._sort_keys = self._build_sort_keys(photos, np.array(mtimes_ns, dtype=np.int64))
+            self._tag_index = self._build_tag_index(photos)
+            # Search hits are resolved through this map instead of rebuilding one per query
+            self._photos_by_path = {photo[0]: photo for photo in photos}
             self.set_sort(self.current_sort)
             
             if status_var:
                 status_var.set(f"Generating captions for {len(photos)} photos...")
             
             self.caption_thread = threading.Thread(
-                target=self._process_captions,
-                args=(self.photos, status_var),
+                target=self._process_background,
+                args=(self.photos, status_var, content_keys, missing_locations),
                 daemon=True
             )
             self.caption_thread.start()
@@ -104,29 +241,101 @@ class PhotoManager:
                 status_var.set(f"Error loading photos: {str(e)}")
             raise
 
-    def _process_captions(self, photos: List[Tuple[str, datetime, int, str, str]], status_var: Optional[tk.StringVar] = None):
+    def get_photo_location(self, file_path: str) -> str:
+        return read_photo_location(file_path)
+
+    def _read_locations(self, file_paths: List[str]) -> List[str]:
+        # Threads overlap the file reads behind EXIF parsing; worker processes would re-import torch
+        # under spawn, or fork a process with live Tk and model threads
+        if len(file_paths) < LOCATION_POOL_MIN_FILES:
+            return [self.get_photo_location(file_path) for file_path in file_paths]
+        with ThreadPoolExecutor(max_workers=min(LOCATION_WORKERS, os.cpu_count() or 1)) as executor:
+            return list(executor.map(read_photo_location, file_paths))
+
+    def _process_background(self, photos: List[Tuple[str, datetime, int, str, str]], status_var: Optional[tk.StringVar] = None,
+                             content_keys: Optional[Dict[str, str]] = None, missing_locations: Optional[List[str]] = None):
+        # load_photos runs on the Tk thread, so EXIF locations are read here after the grid is shown.
+        # They are filled in before captions so caption rows for new photos are written with them
+        if missing_locations:
+            self._backfill_locations(photos, missing_locations, status_var)
+        self._process_captions(photos, status_var, content_keys)
+
+    def _backfill_locations(self, photos: List[Tuple[str, datetime, int, str, str]], file_paths: List[str],
+                            status_var: Optional[tk.StringVar] = None):
+        try:
+            if status_var:
+                status_var.set(f"Reading locations for {len(file_paths)} photos...")
+            locations = dict(zip(file_paths, self._read_locations(file_paths)))
+            updates = []
+            with self._photos_lock:
+                # Replaced by path, since set_sort may have reordered the list since the scan
+                for i, photo in enumerate(photos):
+                    location = locations.get(photo[0])
+                    if location is not None and location != photo[3]:
+                        photos[i] = photo[:3] + (location,) + photo[4:]
+                        if self._photos_by_path.get(photo[0]) is photo:
+                            self._photos_by_path[photo[0]] = photos[i]
+                        updates.append((location, photo[0]))
+            # Only stored rows are updated; new photos get their row, with the location, from the caption pass
+            self.db.update_locations(updates)
+            logging.debug(f"Read locations for {len(file_paths)} photos")
+        except Exception as e:
+            logging.exception(f"Error reading photo locations: {str(e)}")
+
+    def _process_captions(self, photos: List[Tuple[str, datetime, int, str, str]], status_var: Optional[tk.StringVar] = None,
+                          content_keys: Optional[Dict[str, str]] = None, batch_size: int = 8):
         try:
             logging.info("Starting caption processing")
             total = len(photos)
-            for i, (file_path, date, size, location, tags) in enumerate(photos):
+            
+            # Skip photos whose caption is cached for the current file contents
+            existing_metadata = {m["file_path"]: m for m in self.db.get_all_metadata()}
+            pending = []
+            for photo in photos:
+                file_path = photo[0]
+                content_hash = content_keys.get(file_path) if content_keys else None
+                if content_hash is None:
+                    try:
+                        content_hash = file_cache_key(file_path)
+                    except OSError as e:
+                        logging.warning(f"Cannot compute content hash for {file_path}: {str(e)}")
+                metadata = existing_metadata.get(file_path)
+                caption = metadata.get('detailed_caption') if metadata else None
+                # Placeholders stored by older versions are regenerated like missing captions
+                if caption and not is_caption_failure(caption) and metadata.get('content_hash') in (None, content_hash):
+                    logging.debug(f"Skipping caption for {file_path}: already exists")
+                    continue
+                pending.append((photo, content_hash))
+            
+            processed = total - len(pending)
+            # One pass over every pending photo keeps the generator's bounded prefetch queue decoding
+            # upcoming batches while this thread stores the current one
+            start = 0
+            for batch_paths, captions in self.caption_generator.iter_image_captions([photo[0] for photo, _ in pending], batch_size):
+                batch = pending[start:start + len(batch_paths)]
+                start += len(batch_paths)
                 try:
-                    # Skip if caption already exists
-                    metadata = self.db.get_image_metadata(file_path)
-                    if metadata and metadata.get('detailed_caption'):
-                        logging.debug(f"Skipping caption for {file_path}: already exists")
-                        continue
-                    
-                    caption = self.caption_generator.generate_image_caption(file_path)
-                    self.db.add_image(file_path, date.isoformat(), size, location, tags, caption)
-                    
-                    if status_var:
-                        status_var.set(f"Processing captions: {i + 1}/{total}")
-                    
-                    logging.debug(f"Generated caption for {file_path}")
+                    # Failed captions are not stored: with a content hash they would be skipped as cached on every
+                    # later scan. The row is still written so new photos keep their date, size and location
+                    rows = []
+                    generated = []
+                    for ((file_path, date, size, location, tags), content_hash), caption in zip(batch, captions):
+                        if is_caption_failure(caption):
+                            rows.append((file_path, date.isoformat(), size, location, tags, None, None))
+                        else:
+                            rows.append((file_path, date.isoformat(), size, location, tags, caption, content_hash))
+                            generated.append((file_path, caption))
+                    # One transaction per batch instead of one commit per photo
+                    self.db.add_images_bulk(rows)
+                    self._store_caption_embeddings([file_path for file_path, _ in generated], [caption for _, caption in generated])
+                    logging.debug(f"Generated captions for {len(batch)} photos")
                 
                 except Exception as e:
-                    logging.exception(f"Error processing caption for {file_path}: {str(e)}")
-                    continue
+                    logging.exception(f"Error processing caption batch starting at {batch[0][0][0]}: {str(e)}")
+                
+                processed += len(batch)
+                if status_var:
+                    status_var.set(f"Processing captions: {processed}/{total}")
             
             if status_var:
                 status_var.set(f"Processed captions for {total} photos")
@@ -135,60 +344,219 @@ class PhotoManager:
         except Exception as e:
             logging.exception(f"Error in caption processing thread: {str(e)}")
 
+    @staticmethod
+    def _build_sort_keys(photos: List[Tuple[str, datetime, int, str, str]], mtimes_ns: Optional[np.ndarray] = None) -> Dict[str, Any]:
+        # The scan passes raw st_mtime_ns so dates sort as int64 without converting datetime objects
+        if mtimes_ns is None:
+            mtimes_ns = np.array([photo[1] for photo in photos], dtype='datetime64[ns]').view(np.int64)
+        return {
+            'photos': photos,
+            'length': len(photos),
+            'Date': mtimes_ns,
+            'Size': np.fromiter((photo[2] for photo in photos), dtype=np.int64, count=len(photos)),
+            'Name': np.array([photo[0].lower() for photo in photos], dtype=str),
+        }
+
     def set_sort(self, sort_by: str):
         try:
             logging.info(f"Setting sort to {sort_by}")
             self.current_sort = sort_by
-            if sort_by == "Date":
-                self.photos.sort(key=lambda x: x[1], reverse=True)
-            elif sort_by == "Size":
-                self.photos.sort(key=lambda x: x[2], reverse=True)
-            elif sort_by == "Name":
-                self.photos.sort(key=lambda x: x[0].lower())
+            if sort_by not in ("Date", "Size", "Name"):
+                return
+            keys = self._sort_keys
+            if keys is None or keys['photos'] is not self.photos or keys['length'] != len(self.photos):
+                # self.photos was replaced since the keys were built
+                keys = self._sort_keys = self._build_sort_keys(self.photos)
+            # Stable argsort over column arrays; negating keeps ties in order like list.sort(reverse=True)
+            if sort_by == "Name":
+                order = np.argsort(keys['Name'], kind='stable')
+            else:
+                order = np.argsort(-keys[sort_by], kind='stable')
+            with self._photos_lock:
+                self.photos[:] = [self.photos[i] for i in order]
+            for column in ('Date', 'Size', 'Name'):
+                keys[column] = keys[column][order]
             logging.debug(f"Photos sorted by {sort_by}")
         except Exception as e:
             logging.exception(f"Error setting sort to {sort_by}: {str(e)}")
 
+    @staticmethod
+    def _build_tag_index(photos: List[Tuple[str, datetime, int, str, str]]) -> dict:
+        # tag -> paths, so tag matches are set lookups instead of a query per tag
+        index = {}
+        for file_path, _, _, _, tags in photos:
+            for tag in (tags or "").split(","):
+                tag = tag.strip().lower()
+                if tag:
+                    index.setdefault(tag, set()).add(file_path)
+        return index
+
+    def _photos_matching_tags(self, query: str) -> set:
+        return set().union(*(self._tag_index.get(token, ()) for token in query.lower().replace(",", " ").split()))
+
+    def _encode_query_uncached(self, query: str) -> np.ndarray:
+        return self.nlp_model.encode([query], normalize_embeddings=True, show_progress_bar=False)[0]
+
+    def _encode_captions(self, captions: List[str]) -> np.ndarray:
+        return self.nlp_model.encode(
+            captions, batch_size=NLP_BATCH_SIZE, normalize_embeddings=True, show_progress_bar=False
+        )
+
+    def _store_caption_embeddings(self, file_paths: List[str], captions: List[str]):
+        # Embeddings are computed once per caption so search only has to encode the query
+        if not self.nlp_model or not captions:
+            return
+        try:
+            embeddings = self._encode_captions(captions)
+            self.db.update_caption_embeddings([
+                (encode_int8_vector(embedding), file_path) for file_path, embedding in zip(file_paths, embeddings)
+            ])
+        except Exception as e:
+            logging.exception(f"Error storing caption embeddings for {len(file_paths)} photos: {str(e)}")
+
+    def _caption_embeddings(self) -> Tuple[List[List[str]], np.ndarray, np.ndarray, Any]:
+        # Returns the paths sharing each embedding, the (N, D) int8 embedding matrix, per-row dequantization scales and a FAISS
+        # index when faiss is installed, reloading only after captions or embeddings were written
+        cache = self._embedding_cache
+        if cache is not None and cache[0] == self.db.caption_revision:
+            return cache[1:]
+        revision, path_groups, embeddings, scales = self._load_caption_embeddings()
+        entry = (path_groups, embeddings, scales, self._build_faiss_index(embeddings, scales))
+        self._embedding_cache = (revision,) + entry
+        return entry
+
+    @staticmethod
+    def _build_faiss_index(embeddings: np.ndarray, scales: np.ndarray):
+        if not len(embeddings):
+            return None
+        try:
+            import faiss
+        except ImportError:
+            return None
+        # Inner product on unit vectors is cosine similarity; 8-bit codes keep the index as small as the int8 matrix
+        vectors = np.ascontiguousarray(embeddings.astype(np.float32) * scales[:, None])
+        index = faiss.IndexScalarQuantizer(vectors.shape[1], faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+        index.add(vectors)
+        return index
+
+    def _load_caption_embeddings(self) -> Tuple[int, List[List[str]], np.ndarray, np.ndarray]:
+        # The revision is read before the rows it describes, so a concurrent write can only make the cache look stale
+        revision = self.db.caption_revision
+        rows = self.db.get_caption_embeddings()
+        missing = [(file_path, caption) for file_path, caption, embedding in rows if embedding is None]
+        if missing:
+            # Captions written before embeddings were cached, or edited since
+            logging.info(f"Computing caption embeddings for {len(missing)} photos")
+            self._store_caption_embeddings([file_path for file_path, _ in missing], [caption for _, caption in missing])
+            # Storing them bumped the revision; without re-reading it the new cache would be rebuilt on the next search
+            revision = self.db.caption_revision
+            rows = self.db.get_caption_embeddings()
+        rows = [row for row in rows if row[2] is not None]
+        if not rows:
+            return revision, [], np.empty((0, 0), dtype=np.int8), np.empty(0, dtype=np.float32)
+        width = len(rows[-1][2])
+        if any(len(row[2]) != width for row in rows):
+            logging.warning("Ignoring caption embeddings from a different embedding model")
+            rows = [row for row in rows if len(row[2]) == width]
+        # Identical captions quantize to identical blobs; index each distinct vector once and map it back to all its photos
+        groups = {}
+        for file_path, _, embedding in rows:
+            groups.setdefault(embedding, []).append(file_path)
+        embeddings, scales = decode_int8_vectors(list(groups))
+        if len(groups) < len(rows):
+            logging.debug(f"Deduplicated {len(rows)} caption embeddings to {len(groups)}")
+        return revision, list(groups.values()), embeddings, scales
+
+    @staticmethod
+    def _int8_similarities(embeddings: np.ndarray, scales: np.ndarray, query: np.ndarray, block_rows: int = 8192) -> np.ndarray:
+        # Integer dot products over cache-sized blocks keep the int8 matrix at a quarter of float32 bandwidth
+        query_scale = max(float(np.abs(query).max(initial=0.0)), 1e-6) / 127
+        query_i32 = np.round(query / query_scale).astype(np.int32)
+        dots = np.empty(len(embeddings), dtype=np.int32)
+        for start in range(0, len(embeddings), block_rows):
+            dots[start:start + block_rows] = embeddings[start:start + block_rows].astype(np.int32) @ query_i32
+        return dots * (scales * query_scale)
+
     def search_photos(self, query: str) -> List[Tuple[str, datetime, int, str, str]]:
         try:
             logging.info(f"Searching photos with query: {query}")
             if not query:
                 return self.photos
             
-            if not self.nlp_model:
-                logging.warning("NLP model not loaded; returning all photos")
-                return self.photos
-            
-            # Get all captions from database
-            metadata = self.db.get_all_metadata()
-            photo_captions = [(m['file_path'], m.get('detailed_caption', '')) for m in metadata]
-            caption_texts = [caption for _, caption in photo_captions if caption]
-            file_paths = [file_path for file_path, caption in photo_captions if caption]
-            
-            if not caption_texts:
-                logging.warning("No captions found in database")
-                return []
-            
-            # Encode captions and query
-            caption_embeddings = self.nlp_model.encode(caption_texts)
-            query_embedding = self.nlp_model.encode([query])[0]
-            
-            # Compute similarities
-            similarities = np.dot(caption_embeddings, query_embedding) / (
-                np.linalg.norm(caption_embeddings, axis=1) * np.linalg.norm(query_embedding)
-            )
-            
-            # Get top results
-            top_k = min(10, len(file_paths))
-            top_indices = np.argsort(similarities)[::-1][:top_k]
-            results = [
-                photo for photo in self.photos
-                if photo[0] in [file_paths[i] for i in top_indices if similarities[i] > 0.3]
-            ]
+            results = None
+            person = self._match_person(query)
+            if person:
+                # "with <name>" restricts results to a tagged person when faces carry that name;
+                # otherwise the phrase is ordinary caption text ("dog with a ball")
+                name, start, end = person
+                person_paths = set(self.db.get_person_file_paths(name))
+                if person_paths:
+                    text = (query[:start] + query[end:]).strip()
+                    ranked = self._search_text(text) if text else []
+                    results = [photo for photo in ranked if photo[0] in person_paths]
+                    found = {photo[0] for photo in results}
+                    results.extend(photo for photo in self.photos if photo[0] in person_paths and photo[0] not in found)
+            if results is None:
+                results = self._search_text(query)
             
             logging.info(f"Search returned {len(results)} photos for query: {query}")
             return results
             
         except Exception as e:
             logging.exception(f"Error searching photos with query '{query}': {str(e)}")
-            return []
\ No newline at end of file
+            return []
+
+    def _match_person(self, query: str) -> Optional[Tuple[str, int, int]]:
+        # The stored name and the query span it covers, preferring the longest run of words after "with"
+        # that names a tagged face, so "with Tina Smith" finds "Tina Smith" rather than "Tina"
+        matches = list(PERSON_QUERY_PATTERN.finditer(query))
+        if not matches:
+            return None
+        names = {" ".join(name.split()).casefold(): name for name in self.db.get_face_names()}
+        for match in matches:
+            words = list(QUERY_WORD_PATTERN.finditer(query, match.start(1), match.end(1)))
+            for count in range(len(words), 0, -1):
+                name = names.get(" ".join(word.group() for word in words[:count]).casefold())
+                if name:
+                    return name, match.start(), words[count - 1].end()
+        return None
+
+    def _search_text(self, query: str) -> List[Tuple[str, datetime, int, str, str]]:
+        tag_matches = self._photos_matching_tags(query)
+        if not self.load_model():
+            # Without embeddings, fall back to full-text keyword matches over captions and tags
+            keyword_matches = list(dict.fromkeys(self.db.search_captions(query) + sorted(tag_matches)))
+            if keyword_matches:
+                logging.warning("NLP model not loaded; returning keyword matches only")
+                photos_by_path = self._photos_by_path
+                return [photos_by_path[path] for path in keyword_matches if path in photos_by_path]
+            logging.warning("NLP model not loaded; returning all photos")
+            return self.photos
+        
+        path_groups, caption_embeddings, scales, index = self._caption_embeddings()
+        if not path_groups:
+            logging.warning("No captions found in database")
+            return [photo for photo in self.photos if photo[0] in tag_matches]
+        
+        # Embeddings are unit-normalized, so cosine similarity is a single matrix-vector product
+        query_embedding = self._encode_query(query.strip())
+        top_k = min(10, len(path_groups))
+        if index is not None:
+            scores, top_indices = index.search(np.asarray(query_embedding, dtype=np.float32)[None, :], top_k)
+            scores, top_indices = scores[0], top_indices[0]
+        else:
+            similarities = self._int8_similarities(caption_embeddings, scales, query_embedding)
+            # Top results without sorting the whole library
+            top_indices = np.argpartition(-similarities, top_k - 1)[:top_k]
+            top_indices = top_indices[np.argsort(-similarities[top_indices])]
+            scores = similarities[top_indices]
+        photos_by_path = self._photos_by_path
+        results = [
+            photos_by_path[file_path] for score, i in zip(scores, top_indices) if score > 0.3 and i >= 0
+            for file_path in path_groups[i] if file_path in photos_by_path
+        ]
+        # Exact tag hits follow the semantic matches
+        found = {photo[0] for photo in results}
+        results.extend(photos_by_path[path] for path in tag_matches - found if path in photos_by_path)
+        return results
@@ -0,0 +1,167 @@
+import unittest
+import pickle
+import threading
+import gc
+import numpy as np
+from database import (
+    ImageDatabase, encode_int8_vector, decode_int8_vectors,
+    encode_face_encoding, decode_face_encoding, decode_face_encodings
+)
+
+
+class TestVectorEncoding(unittest.TestCase):
+    def test_int8_vector_round_trip(self):
+        rng = np.random.default_rng(0)
+        vectors = rng.standard_normal((5, 384)).astype(np.float32)
+        quantized, scales = decode_int8_vectors([encode_int8_vector(v) for v in vectors])
+        self.assertEqual(quantized.shape, (5, 384))
+        self.assertEqual(quantized.dtype, np.int8)
+        decoded = quantized.astype(np.float32) * scales[:, None]
+        # Absmax int8 quantization is accurate to half a step of the largest component
+        tolerance = np.abs(vectors).max(axis=1, keepdims=True) / 127
+        self.assertTrue(np.all(np.abs(decoded - vectors) <= tolerance))
+
+    def test_zero_vector_encodes(self):
+        blob = encode_int8_vector(np.zeros(128))
+        self.assertEqual(len(blob), 4 + 128)
+        self.assertTrue(np.all(decode_face_encoding(blob) == 0))
+
+    def test_face_encoding_size_and_round_trip(self):
+        encoding = np.linspace(-0.3, 0.3, 128)
+        blob = encode_face_encoding(encoding)
+        self.assertEqual(len(blob), 132)
+        np.testing.assert_allclose(decode_face_encoding(blob), encoding, atol=0.3 / 127)
+
+    def test_legacy_pickled_face_encoding(self):
+        encoding = np.arange(128, dtype=np.float64) / 128
+        legacy = pickle.dumps(encoding)
+        np.testing.assert_allclose(decode_face_encoding(legacy), encoding, rtol=1e-6)
+        # A result set mixing legacy and int8 rows decodes row by row
+        mixed = decode_face_encodings([legacy, encode_face_encoding(encoding)])
+        self.assertEqual(mixed.shape, (2, 128))
+        np.testing.assert_allclose(mixed[1], encoding, atol=1 / 127)
+
+
+class TestImageDatabase(unittest.TestCase):
+    def setUp(self):
+        self.db = ImageDatabase(":memory:")
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_upsert_keeps_caption_and_hash_when_omitted(self):
+        self.db.add_image("/a.jpg", "2023-01-01", 1024, "Unknown", "dog", "A dog", "key-1")
+        self.db.add_images_bulk([("/a.jpg", "2023-01-02", 2048, "1.0, 2.0", "dog, park", None, None)])
+        metadata = self.db.get_image_metadata("/a.jpg")
+        self.assertEqual(metadata["detailed_caption"], "A dog")
+        self.assertEqual(metadata["content_hash"], "key-1")
+        self.assertEqual(metadata["size"], 2048)
+        self.assertEqual(metadata["tags"], "dog, park")
+        self.assertEqual(len(self.db.get_all_metadata()), 1)
+
+    def test_caption_change_clears_embedding(self):
+        self.db.add_image("/a.jpg", "2023-01-01", 1024, "Unknown", "", "A dog")
+        self.db.update_caption_embeddings([(encode_int8_vector(np.ones(4)), "/a.jpg")])
+        # Re-saving the same caption keeps the embedding
+        self.db.add_image("/a.jpg", "2023-01-01", 1024, "Unknown", "", "A dog")
+        self.assertIsNotNone(self.db.get_caption_embeddings()[0][2])
+        self.db.add_image("/a.jpg", "2023-01-01", 1024, "Unknown", "", "A cat")
+        self.assertEqual(self.db.get_caption_embeddings(), [("/a.jpg", "A cat", None)])
+
+    def test_caption_revision_bumps_on_writes(self):
+        revision = self.db.caption_revision
+        self.db.add_image("/a.jpg", "2023-01-01", 1024, "Unknown", "", "A dog")
+        self.assertGreater(self.db.caption_revision, revision)
+        revision = self.db.caption_revision
+        self.db.update_caption_embeddings([(encode_int8_vector(np.ones(4)), "/a.jpg")])
+        self.assertGreater(self.db.caption_revision, revision)
+
+    def test_caption_search_follows_inserts_updates_and_deletes(self):
+        self.db.add_image("/a.jpg", "2023-01-01", 1024, "Unknown", "park", "A dog running")
+        self.db.add_image("/b.jpg", "2023-01-01", 1024, "Unknown", "house", "A cat sleeping")
+        self.assertEqual(self.db.search_captions("dog"), ["/a.jpg"])
+        self.assertEqual(self.db.search_captions("house"), ["/b.jpg"])
+        # Non-text updates leave the index intact
+        self.db.update_locations([("1.0, 2.0", "/a.jpg")])
+        self.assertEqual(self.db.search_captions("running dog"), ["/a.jpg"])
+        self.db.add_image("/a.jpg", "2023-01-01", 1024, "1.0, 2.0", "beach", "A horse on a beach")
+        self.assertEqual(self.db.search_captions("dog"), [])
+        self.assertEqual(self.db.search_captions("horse"), ["/a.jpg"])
+        with self.db._connection() as conn:
+            conn.execute("DELETE FROM images WHERE file_path = ?", ("/b.jpg",))
+        self.assertEqual(self.db.search_captions("cat"), [])
+
+    def test_caption_search_quotes_user_input(self):
+        self.db.add_image("/a.jpg", "2023-01-01", 1024, "Unknown", "", "A dog")
+        self.assertEqual(self.db.search_captions('dog" OR "x'), [])
+        self.assertEqual(self.db.search_captions("!!!"), [])
+
+    def test_update_face_name_picks_closest_face(self):
+        near = np.full(128, 0.1)
+        far = np.full(128, -0.2)
+        self.db.add_faces_bulk([
+            ("/a.jpg", near, None, 10, 20, 20, 10),
+            ("/a.jpg", far, None, 30, 40, 40, 30),
+        ])
+        # The stored encoding went through int8, so the name must match by distance rather than bytes
+        self.db.update_face_name("/a.jpg", near + 0.001, "Tina")
+        names = {face["top"]: face["name"] for face in self.db.get_faces("/a.jpg")}
+        self.assertEqual(names, {10: "Tina", 30: None})
+
+    def test_person_file_paths_include_matching_untagged_faces(self):
+        self.db.add_face("/tagged.jpg", np.full(128, 0.1), "Tina", 1, 2, 2, 1)
+        self.db.add_face("/same.jpg", np.full(128, 0.11), None, 1, 2, 2, 1)
+        self.db.add_face("/other.jpg", np.full(128, -0.1), None, 1, 2, 2, 1)
+        self.db.add_face("/bob.jpg", np.full(128, 0.1), "Bob", 1, 2, 2, 1)
+        self.assertEqual(self.db.get_person_file_paths("tina"), ["/tagged.jpg", "/same.jpg"])
+        self.assertEqual(self.db.get_person_file_paths("Nobody"), [])
+
+    def test_match_faces_returns_nearest_first_per_query(self):
+        self.db.add_face("/a.jpg", np.full(128, 0.1), "Tina", 1, 2, 2, 1)
+        self.db.add_face("/b.jpg", np.full(128, 0.12), None, 1, 2, 2, 1)
+        self.db.add_face("/c.jpg", np.full(128, -0.1), None, 1, 2, 2, 1)
+        matches = self.db.match_faces([np.full(128, 0.105), np.full(128, 0.5)])
+        self.assertEqual([m["file_path"] for m in matches[0]], ["/a.jpg", "/b.jpg"])
+        self.assertEqual(matches[0][0]["name"], "Tina")
+        self.assertEqual(matches[1], [])
+
+    def test_reuse_faces_copies_scanned_contents(self):
+        self.db.add_faces_bulk([("/a.jpg", np.full(128, 0.1), "Tina", 1, 2, 2, 1)], content_hash="digest")
+        self.assertFalse(self.db.reuse_faces("/b.jpg", "unknown"))
+        self.assertTrue(self.db.reuse_faces("/b.jpg", "digest"))
+        faces = self.db.get_faces("/b.jpg")
+        self.assertEqual(len(faces), 1)
+        self.assertEqual(faces[0]["name"], "Tina")
+
+    def test_face_scan_hash_follows_cache_key(self):
+        self.assertIsNone(self.db.get_face_scan_hash("/a.jpg", "1-100"))
+        self.db.save_face_scan_hash("/a.jpg", "1-100", "digest")
+        self.assertEqual(self.db.get_face_scan_hash("/a.jpg", "1-100"), "digest")
+        # A rewritten file changes its mtime+size key, so its contents must be hashed again
+        self.db.save_face_scan_hash("/a.jpg", "2-120", "digest-2")
+        self.assertIsNone(self.db.get_face_scan_hash("/a.jpg", "1-100"))
+        self.assertEqual(self.db.get_face_scan_hash("/a.jpg", "2-120"), "digest-2")
+
+    def test_memory_database_is_shared_across_threads(self):
+        self.db.add_image("/a.jpg", "2023-01-01", 1024, "Unknown", "", "A dog")
+        seen = []
+        thread = threading.Thread(target=lambda: seen.append(len(self.db.get_all_metadata())))
+        thread.start()
+        thread.join()
+        self.assertEqual(seen, [1])
+        # Separate instances never share data
+        other = ImageDatabase(":memory:")
+        self.assertEqual(other.get_all_metadata(), [])
+        other.close()
+
+    def test_thread_connections_close_when_threads_exit(self):
+        for _ in range(5):
+            thread = threading.Thread(target=self.db.get_all_metadata)
+            thread.start()
+            thread.join()
+        gc.collect()
+        self.assertEqual(len(self.db._connections), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
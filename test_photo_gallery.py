@@ -5,16 +5,43 @@ from datetime import datetime
 from PIL import Image
 import numpy as np
 from photo_manager import PhotoManager
-from caption_generator import CaptionGenerator
-from ui_manager import UIManager, GifAnimation
+from caption_generator import get_caption_generator
+from ui_manager import UIManager
 from database import ImageDatabase
+import face_detector
 import tkinter as tk
 import threading
 import queue
 import logging
 import importlib.util
+import io
+import shutil
+import tempfile
 
-classerend (self):
+class TestPhotoGallery(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Florence-2 is stateless between tests, so every test shares the process-wide instance
+        cls.caption_generator = get_caption_generator()
+
+    def setUp(self):
+        self.root = tk.Tk()
+        self.status_var = tk.StringVar()
+        # Log records are captured in memory; assertions read the buffer instead of reopening a file
+        self.log_stream = io.StringIO()
+        handler = logging.StreamHandler(self.log_stream)
+        handler.setLevel(logging.DEBUG)
+        logging.getLogger().setLevel(logging.DEBUG)
+        logging.getLogger().addHandler(handler)
+        # A file database, not :memory:, so background threads writing alongside the test get normal locking
+        self.temp_dir = tempfile.mkdtemp()
+        self.db = ImageDatabase(os.path.join(self.temp_dir, "test.db"))
+        self.photo_manager = PhotoManager(self.caption_generator, self.db)
+        self.ui_manager = UIManager(self.root, self.photo_manager, self.caption_generator, self.db, self.status_var)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
         self.root.destroy()
         logging.getLogger().handlers = []
 
@@ -29,18 +56,16 @@ classerend (self):
 
     def test_logging_to_file(self):
         logging.info("Test log message")
-        with open(self.log_file, 'r') as f:
-            log_content = f.read()
+        log_content = self.log_stream.getvalue()
         self.assertIn("Test log message", log_content)
 
     def test_model_files_missing(self):
-        with patch('os.path.exists', return_value=False):
-            self.photo_manager.load_model()
-            self.assertIsNone(self.photo_manager.face_net)
-            with open(self.log_file, 'r') as f:
-                log_content = f.read()
-            self.assertIn("OpenCV DNN model files missing", log_content)
-            self.assertIn("Face detection disabled", log_content)
+        # SPG_FACE_MODEL_DIR is read at import, so point the loaded module at a folder without the SSD files
+        with patch.multiple(face_detector, FACE_MODEL_DIR=self.temp_dir, _face_net=None, _face_net_loaded=False):
+            self.assertIsNone(face_detector._get_face_net())
+            log_content = self.log_stream.getvalue()
+            self.assertIn(f"SSD face detector not found in {self.temp_dir}", log_content)
+            self.assertIn("using HOG", log_content)
 
     def test_get_all_metadata(self):
         self.db.add_image("/test.jpg", "2023-01-01", 1024, "Unknown", "dog, park")
@@ -50,8 +75,8 @@ classerend (self):
         self.assertEqual(metadata[0]["tags"], "dog, park")
 
     def test_load_photos_with_get_all_metadata(self):
-        with patch('os.walk') as mock_walk:
-            mock_walk.return_value = [('/test', [], ['test.jpg'])]
+        with patch('photo_manager.scan_images') as mock_scan:
+            mock_scan.return_value = [('/test/test.jpg', Mock(st_mtime=1630000000, st_mtime_ns=1630000000 * 10**9, st_size=1024))]
             with patch('os.stat') as mock_stat:
                 mock_stat.return_value = Mock(st_mtime=1630000000, st_size=1024)
                 with patch('os.path.exists', return_value=True):
@@ -70,8 +95,7 @@ classerend (self):
         self.db.add_image("/test/test.jpg", "2023-01-01", 1024, "Unknown", "dog, park")
         with patch.object(self.photo_manager, 'nlp_model', None):
             self.photo_manager.search_photos("dog")
-            with open(self.log_file, 'r') as f:
-                log_content = f.read()
+            log_content = self.log_stream.getvalue()
             self.assertIn("Searching photos with query: dog", log_content)
             self.assertIn("Search returned", log_content)
 
@@ -80,32 +104,11 @@ classerend (self):
         self.assertEqual(self.ui_manager.status_var, self.status_var)
         self.assertTrue(self.ui_manager.caption_thread.is_alive())
 
-    def test_gif_animation_overlay_creation(self):
-        anim = GifAnimation(self.root, self.root, "Loading", "loading.gif")
-        with patch('PIL.Image.open') as mock_open:
-            mock_img = Mock()
-            mock_img.n_frames = 2
-            mock_img.copy.return_value.resize.return_value = Mock()
-            mock_open.return_value.__enter__.return_value = mock_img
-            anim.load_gif()
-            anim.create_overlay()
-            self.assertIsNotNone(anim.overlay)
-            self.assertIsNotNone(anim.label)
-            self.assertTrue(anim.overlay.winfo_exists())
-
-    def test_gif_animation_start_with_failed_overlay(self):
-        anim = GifAnimation(self.root, self.root, "Loading", "loading.gif")
-        with patch('tkinter.Toplevel', side_effect=Exception("Toplevel creation failed")):
-            anim.start()
-            self.assertTrue(anim.running)
-            self.assertIsNotNone(anim.label)
-            self.assertEqual(anim.label.cget("text"), "Loading...")
-
     def test_select_folder_with_spinner_failure(self):
         with patch('tkinter.filedialog.askdirectory', return_value='/test'):
             with patch.object(self.ui_manager.folder_spinner, 'start', side_effect=Exception("Spinner failed")):
-                with patch('os.walk') as mock_walk:
-                    mock_walk.return_value = [('/test', [], ['test.jpg'])]
+                with patch('photo_manager.scan_images') as mock_scan:
+                    mock_scan.return_value = [('/test/test.jpg', Mock(st_mtime=1630000000, st_mtime_ns=1630000000 * 10**9, st_size=1024))]
                     with patch('os.stat') as mock_stat:
                         mock_stat.return_value = Mock(st_mtime=1630000000, st_size=1024)
                         with patch('os.path.exists', return_value=True):
@@ -120,8 +123,8 @@ classerend (self):
                                         self.assertEqual(len(self.ui_manager.displayed_photos), 1)
 
     def test_load_photos_valid_folder(self):
-        with patch('os.walk') as mock_walk:
-            mock_walk.return_value = [('/test', [], ['test.jpg'])]
+        with patch('photo_manager.scan_images') as mock_scan:
+            mock_scan.return_value = [('/test/test.jpg', Mock(st_mtime=1630000000, st_mtime_ns=1630000000 * 10**9, st_size=1024))]
             with patch('os.stat') as mock_stat:
                 mock_stat.return_value = Mock(st_mtime=1630000000, st_size=1024)
                 with patch('os.path.exists', return_value=True):
@@ -134,7 +137,7 @@ classerend (self):
 
     def test_load_photos_invalid_folder(self):
         with patch('os.path.exists', return_value=False):
-            with self.assertRaises(Value  TestPhotoGallery(unittest.TestCase):
+            with self.assertRaises(ValueError):
                 self.photo_manager.load_photos('/invalid', self.status_var)
             self.assertIn("Error loading photos", self.status_var.get())
 
@@ -147,8 +150,8 @@ classerend (self):
                     self.assertIn("Error loading photos", self.status_var.get())
 
     def test_load_photos_empty_folder(self):
-        with patch('os.walk') as mock_walk:
-            mock_walk.return_value = [('/test', [], [])]
+        with patch('photo_manager.scan_images') as mock_scan:
+            mock_scan.return_value = []
             with patch('os.path.exists', return_value=True):
                 with patch('os.path.isdir', return_value=True):
                     with patch('os.access', return_value=True):
@@ -160,8 +163,7 @@ classerend (self):
         with patch('os.path.exists', return_value=False):
             with self.assertRaises(ValueError):
                 self.photo_manager.load_photos('/invalid', self.status_var)
-            with open(self.log_file, 'r') as f:
-                log_content = f.read()
+            log_content = self.log_stream.getvalue()
             self.assertIn("Folder does not exist: /invalid", log_content)
 
     def test_immediate_ui_load(self):
@@ -172,8 +174,8 @@ classerend (self):
             mock_load_model.assert_called_once()
 
     def test_status_bar_updates(self):
-        with patch('os.walk') as mock_walk:
-            mock_walk.return_value = [('/test', [], ['test.jpg'])]
+        with patch('photo_manager.scan_images') as mock_scan:
+            mock_scan.return_value = [('/test/test.jpg', Mock(st_mtime=1630000000, st_mtime_ns=1630000000 * 10**9, st_size=1024))]
             with patch('os.stat') as mock_stat:
                 mock_stat.return_value = Mock(st_mtime=1630000000, st_size=1024)
                 with patch('os.path.exists', return_value=True):
@@ -183,8 +185,8 @@ classerend (self):
                             self.assertIn("Scanning /test...", self.status_var.get())
 
     def test_thumbnail_display_immediate(self):
-        with patch('os.walk') as mock_walk:
-            mock_walk.return_value = [('/test', [], ['test.jpg'])]
+        with patch('photo_manager.scan_images') as mock_scan:
+            mock_scan.return_value = [('/test/test.jpg', Mock(st_mtime=1630000000, st_mtime_ns=1630000000 * 10**9, st_size=1024))]
             with patch('os.stat') as mock_stat:
                 mock_stat.return_value = Mock(st_mtime=1630000000, st_size=1024)
                 with patch('os.path.exists', return_value=True):
@@ -197,8 +199,8 @@ classerend (self):
                                 self.assertEqual(self.ui_manager.scrollable_frame.winfo_children()[0].winfo_children()[1].cget("text"), "test.jpg")
 
     def test_background_metadata_processing(self):
-        with patch('os.walk') as mock_walk:
-            mock_walk.return_value = [('/test', [], ['test.jpg'])]
+        with patch('photo_manager.scan_images') as mock_scan:
+            mock_scan.return_value = [('/test/test.jpg', Mock(st_mtime=1630000000, st_mtime_ns=1630000000 * 10**9, st_size=1024))]
             with patch('os.stat') as mock_stat:
                 mock_stat.return_value = Mock(st_mtime=1630000000, st_size=1024)
                 with patch('os.path.exists', return_value=True):
@@ -212,8 +214,8 @@ classerend (self):
                                     self.assertEqual(metadata["tags"], "dog, park")
 
     def test_background_face_processing(self):
-        with patch('os.walk') as mock_walk:
-            mock_walk.return_value = [('/test', [], ['test.jpg'])]
+        with patch('photo_manager.scan_images') as mock_scan:
+            mock_scan.return_value = [('/test/test.jpg', Mock(st_mtime=1630000000, st_mtime_ns=1630000000 * 10**9, st_size=1024))]
             with patch('os.stat') as mock_stat:
                 mock_stat.return_value = Mock(st_mtime=1630000000, st_size=1024)
                 with patch('os.path.exists', return_value=True):
@@ -236,9 +238,6 @@ classerend (self):
             self.assertTrue(full_image_window.winfo_exists())
             caption_label = full_image_window.winfo_children()[3].winfo_children()[0]
             self.assertEqual(caption_label.cget("text"), "Generating caption...")
-            # Verify no GifAnimation instances
-            for child in full_image_window.winfo_children():
-                self.assertNotIsInstance(child, GifAnimation)
 
     def test_background_caption_thread_safe(self):
         with patch('PIL.Image.open') as mock_open:
@@ -264,21 +263,6 @@ classerend (self):
             self.assertEqual(labels[0].cget("text"), "Face 1")
             self.assertTrue(int(labels[0].place_info()["x"]) >= 100)
 
-    def test_gif_animation_load_success(self):
-        with patch('PIL.Image.open') as mock_open:
-            mock_img = Mock()
-            mock_img.n_frames = 2
-            mock_img.copy.return_value.resize.return_value = Mock()
-            mock_open.return_value.__enter__.return_value = mock_img
-            anim = GifAnimation(self.root, self.root, "Loading", "loading.gif")
-            self.assertEqual(len(anim.frames), 2)
-            with patch.object(anim, 'create_overlay') as mock_create:
-                anim.start()
-                mock_create.assert_called_once()
-                self.assertTrue(anim.running)
-                anim.stop()
-                self.assertFalse(anim.running)
-
     def test_mousewheel_unbinding(self):
         with patch('PIL.Image.open') as mock_open:
             mock_open.return_value = Mock()
@@ -322,5 +306,18 @@ classerend (self):
             self.assertEqual(len(results), 1)
             self.assertEqual(results[0][0], 'img1.jpg')
 
+    def test_person_based_search_full_name(self):
+        self.photo_manager.photos = [
+            ('img1.jpg', datetime.now(), 1024, "Unknown", "dog, park"),
+            ('img2.jpg', datetime.now(), 2048, "Unknown", "cat, house")
+        ]
+        self.db.add_face('img1.jpg', np.zeros(512), "Tina Smith", 100, 200, 200, 100)
+        self.db.add_face('img2.jpg', np.ones(512), "Tina", 100, 200, 200, 100)
+        with patch.object(self.photo_manager, 'nlp_model', None):
+            results = self.photo_manager.search_photos("dog with a ball with tina  smith")
+            self.assertEqual([photo[0] for photo in results], ['img1.jpg'])
+            results = self.photo_manager.search_photos("with Tina")
+            self.assertEqual([photo[0] for photo in results], ['img2.jpg'])
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
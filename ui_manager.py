@@ -1,16 +1,20 @@
 import tkinter as tk
 from tkinter import ttk, filedialog
 import os
+import io
+import math
+from collections import OrderedDict
 from PIL import Image, ImageTk
 import logging
 from typing import Optional
 from photo_manager import PhotoManager
-from caption_generator import CaptionGenerator
+from caption_generator import CaptionGenerator, cached_caption, load_rgb_image
 from database import ImageDatabase
+from utils import file_cache_key, file_content_digest
 import threading
 import queue
-import cv2
-import face_recognition
+from concurrent.futures import ThreadPoolExecutor
+from face_detector import detect_faces
 import numpy as np
 
 class UIManager:
@@ -21,6 +25,19 @@ class UIManager:
         self.db = db
         self.status_var = status_var
         self.displayed_photos = []
+        self.thumbnail_size = (200, 200)
+        # Only cells near the viewport exist as widgets; PhotoImages are kept in a bounded LRU
+        self.max_cols = 4
+        self.cell_width = self.thumbnail_size[0] + 10
+        self.row_height = self.thumbnail_size[1] + 40
+        self._visible_cells = {}
+        self._thumbnail_cache = OrderedDict()
+        self._thumbnail_cache_size = 200
+        # Thumbnails decode off the Tk thread; the generation counter drops results from stale grids
+        self.thumbnail_executor = ThreadPoolExecutor(max_workers=min(8, (os.cpu_count() or 1) * 2))
+        self._display_generation = 0
+        # Queued decodes per visible cell; cancelled when the cell goes, so fast scrolling can't pile up work
+        self._pending_thumbnails = {}
         self.caption_queue = queue.Queue()
         self.caption_thread = threading.Thread(target=self._process_captions, daemon=True)
         self.caption_thread.start()
@@ -61,7 +78,7 @@ class UIManager:
             lambda e: self.canvas.configure(scrollregion=self.canvas.bbox("all"))
         )
         
-        self.canvas.configure(yscrollcommand=self.scrollbar.set)
+        self.canvas.configure(yscrollcommand=self._on_grid_scroll)
         
         self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
@@ -79,6 +96,10 @@ class UIManager:
     def _on_canvas_configure(self, event):
         self.canvas.itemconfig(self.canvas_frame, width=event.width)
 
+    def _on_grid_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self._render_visible_cells()
+
     def select_folder(self):
         try:
             if not self.photo_manager or not self.caption_generator:
@@ -111,38 +132,117 @@ class UIManager:
     def display_photos(self, photos: list):
         for widget in self.scrollable_frame.winfo_children():
             widget.destroy()
+        self._visible_cells = {}
+        for future in self._pending_thumbnails.values():
+            future.cancel()
+        self._pending_thumbnails = {}
         
+        self._display_generation += 1
         self.displayed_photos = photos
         if not photos:
+            self.canvas.itemconfig(self.canvas_frame, height=1)
             self.status_var.set("No photos found")
             return
         
-        max_cols = 4
-        thumbnail_size = (200, 200)
+        # Size the frame for the whole grid so the scrollbar reflects every photo
+        rows = math.ceil(len(photos) / self.max_cols)
+        self.canvas.itemconfig(self.canvas_frame, height=rows * self.row_height)
+        self.canvas.yview_moveto(0)
+        self._render_visible_cells()
         
-        for i, (file_path, date, size, location, tags) in enumerate(photos):
-            try:
-                img = Image.open(file_path)
-                img.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
-                photo = ImageTk.PhotoImage(img)
-                
-                frame = ttk.Frame(self.scrollable_frame)
-                row = i // max_cols
-                col = i % max_cols
-                frame.grid(row=row, column=col, padx=5, pady=5)
-                
-                label = ttk.Label(frame, image=photo)
+        self.status_var.set(f"Displaying {len(photos)} photos")
+
+    def _render_visible_cells(self):
+        if not self.displayed_photos:
+            return
+        top = self.canvas.canvasy(0)
+        bottom = self.canvas.canvasy(self.canvas.winfo_height())
+        first_row = max(0, int(top // self.row_height) - 1)
+        last_row = int(bottom // self.row_height) + 1
+        wanted = range(first_row * self.max_cols, min(len(self.displayed_photos), (last_row + 1) * self.max_cols))
+        
+        for index in [i for i in self._visible_cells if i not in wanted]:
+            self._visible_cells.pop(index).destroy()
+            future = self._pending_thumbnails.pop(index, None)
+            if future is not None:
+                future.cancel()
+        for index in wanted:
+            if index not in self._visible_cells:
+                self._create_cell(index)
+
+    def _create_cell(self, index: int):
+        file_path = self.displayed_photos[index][0]
+        try:
+            frame = ttk.Frame(self.scrollable_frame)
+            row = index // self.max_cols
+            col = index % self.max_cols
+            frame.place(x=col * self.cell_width + 5, y=row * self.row_height + 5)
+            self._visible_cells[index] = frame
+            
+            label = ttk.Label(frame, text="Loading...")
+            label.pack()
+            label.bind("<Double-1>", lambda e, path=file_path: self.open_full_image(path))
+            
+            name_label = ttk.Label(frame, text=os.path.basename(file_path))
+            name_label.pack()
+            
+            photo = self._thumbnail_cache.get(file_path)
+            if photo is not None:
+                self._thumbnail_cache.move_to_end(file_path)
+                label.config(image=photo, text="")
                 label.image = photo
-                label.pack()
-                label.bind("<Double-1>", lambda e, path=file_path: self.open_full_image(path))
-                
-                logging.debug(f"Displayed thumbnail for {file_path}")
-                
-            except Exception as e:
-                logging.exception(f"Error displaying thumbnail for {file_path}: {str(e)}")
-                continue
+                return
+            
+            generation = self._display_generation
+            future = self.thumbnail_executor.submit(self._load_thumbnail, file_path)
+            self._pending_thumbnails[index] = future
+            future.add_done_callback(
+                lambda f, lbl=label, path=file_path, i=index: self.root.after(0, self._show_thumbnail, f, lbl, generation, path, i)
+            )
+        except Exception as e:
+            logging.exception(f"Error displaying thumbnail for {file_path}: {str(e)}")
+
+    def _load_thumbnail(self, file_path: str) -> Image.Image:
+        cache_key = file_cache_key(file_path)
+        cached = self.db.get_thumbnail(file_path, cache_key)
+        if cached:
+            img = Image.open(io.BytesIO(cached))
+            img.load()
+            return img
         
-        self.status_var.set(f"Displaying {len(photos)} photos")
+        img = Image.open(file_path)
+        # Let libjpeg decode at a reduced DCT scale instead of full resolution
+        img.draft("RGB", self.thumbnail_size)
+        img.thumbnail(self.thumbnail_size, Image.Resampling.LANCZOS)
+        
+        buffer = io.BytesIO()
+        try:
+            img.save(buffer, format="WEBP", quality=80)
+        except (OSError, KeyError, ValueError):
+            # Pillow built without WebP support
+            buffer = io.BytesIO()
+            img.convert("RGB").save(buffer, format="JPEG", quality=85)
+        self.db.save_thumbnail(file_path, cache_key, buffer.getvalue())
+        return img
+
+    def _show_thumbnail(self, future, label, generation: int, file_path: str, index: int):
+        try:
+            if generation != self._display_generation or future.cancelled():
+                return
+            if self._pending_thumbnails.get(index) is future:
+                del self._pending_thumbnails[index]
+            photo = ImageTk.PhotoImage(future.result())
+            self._thumbnail_cache[file_path] = photo
+            if len(self._thumbnail_cache) > self._thumbnail_cache_size:
+                self._thumbnail_cache.popitem(last=False)
+            # The cell may have scrolled out of view while the thumbnail was decoding
+            if not label.winfo_exists():
+                return
+            label.config(image=photo, text="")
+            label.image = photo
+            logging.debug(f"Displayed thumbnail for {file_path}")
+        except Exception as e:
+            logging.exception(f"Error displaying thumbnail for {file_path}: {str(e)}")
 
     def open_full_image(self, file_path: str):
         try:
@@ -164,8 +264,9 @@ class UIManager:
             canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
             
             # Load image
-            img = Image.open(file_path)
-            original_img = img.copy()
+            # Decoded once here; display, zoom and face detection all work from this image
+            original_img = load_rgb_image(file_path)
+            img = original_img.copy()
             orig_width, orig_height = img.size
             
             # Initial scale to fit screen
@@ -183,6 +284,9 @@ class UIManager:
             # Zoom state
             self.zoom_factor = 1.0
             self.base_img = original_img
+            # The screen-fit copy doubles as a mipmap for zoomed-out views
+            self.display_img = img
+            self.display_scale = img_width / orig_width
             self.face_rects = []
             
             # Zoom buttons
@@ -199,50 +303,50 @@ class UIManager:
             caption_frame = ttk.Frame(control_frame)
             caption_frame.pack(fill=tk.X, side=tk.LEFT)
             
-            caption_label = ttk.Label(caption_frame, text="Generating caption...")
+            # Show a stored caption immediately; only queue generation on a cache miss
+            caption = cached_caption(file_path, self.db.get_image_metadata(file_path))
+            caption_label = ttk.Label(caption_frame, text=caption or "Generating caption...")
             caption_label.pack(pady=5)
             
-            self.caption_queue.put((file_path, caption_label))
+            if caption is None:
+                self.caption_queue.put((file_path, caption_label))
             
-            # Clear existing faces for this image to avoid stale data
-            self.db.clear_faces(file_path)
-            logging.debug(f"Cleared existing faces for {file_path}")
-            
-            # Face detection
-            img_cv = cv2.imread(file_path)
-            if img_cv is None:
-                logging.warning(f"Failed to read image for face detection: {file_path}")
-                # Fallback: Try PIL and convert to OpenCV
-                try:
-                    pil_img = Image.open(file_path).convert('RGB')
-                    img_cv = np.array(pil_img)
-                    img_cv = img_cv[:, :, ::-1]  # RGB to BGR
-                    logging.debug(f"Fallback image load successful for {file_path}")
-                except Exception as e:
-                    logging.exception(f"Fallback image load failed for {file_path}: {str(e)}")
-            
-            if img_cv is not None:
+            # Unchanged (or moved) files keep their stored faces and names instead of being re-detected.
+            # A file already scanned at this path with the same mtime+size reuses its stored hash,
+            # so only new or changed files are read in full on the Tk thread
+            cache_key = content_hash = None
+            try:
+                cache_key = file_cache_key(file_path)
+                content_hash = self.db.get_face_scan_hash(file_path, cache_key) or file_content_digest(file_path)
+            except OSError as e:
+                logging.warning(f"Cannot hash {file_path}: {str(e)}")
+            
+            if content_hash and self.db.reuse_faces(file_path, content_hash):
+                logging.debug(f"Using stored faces for {file_path}")
+            else:
+                # Clear existing faces for this image to avoid stale data
+                self.db.clear_faces(file_path)
+                logging.debug(f"Cleared existing faces for {file_path}")
+                
+                # Face detection; face_recognition loads dlib's models, so import it only once an image is opened
                 try:
-                    rgb_img = cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB)
-                    face_locations = face_recognition.face_locations(rgb_img, model='hog')
+                    import face_recognition
+                    rgb_img = np.asarray(original_img)
+                    face_locations = detect_faces([rgb_img])[0]
                     encodings = face_recognition.face_encodings(rgb_img, face_locations)
                     
+                    face_rows = []
                     for (top, right, bottom, left), encoding in zip(face_locations, encodings):
                         if encoding is not None:
-                            self.db.add_face(
-                                file_path,
-                                encoding,
-                                None,
-                                int(top),
-                                int(right),
-                                int(bottom),
-                                int(left)
-                            )
-                            logging.debug(f"Stored face for {file_path} at ({left}, {top}, {right}, {bottom})")
+                            face_rows.append((file_path, encoding, None, int(top), int(right), int(bottom), int(left)))
+                            logging.debug(f"Detected face for {file_path} at ({left}, {top}, {right}, {bottom})")
                         else:
                             logging.warning(f"No encoding for face at ({left}, {top}, {right}, {bottom}) in {file_path}")
+                    self.db.add_faces_bulk(face_rows, content_hash)
                 except Exception as e:
                     logging.exception(f"Error during face detection for {file_path}: {str(e)}")
+            if cache_key and content_hash:
+                self.db.save_face_scan_hash(file_path, cache_key, content_hash)
             
             # Draw clickable rectangles for faces
             faces = self.db.get_faces(file_path)
@@ -401,7 +505,13 @@ class UIManager:
                     # Resize image
                     new_width = int(orig_width * self.zoom_factor)
                     new_height = int(orig_height * self.zoom_factor)
-                    resized_img = self.base_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
+                    if self.zoom_factor <= self.display_scale:
+                        resized_img = self.display_img.resize((new_width, new_height), Image.Resampling.BILINEAR)
+                    elif self.zoom_factor < 1.0:
+                        # reducing_gap box-reduces first so the bicubic pass touches far fewer pixels
+                        resized_img = self.base_img.resize((new_width, new_height), Image.Resampling.BICUBIC, reducing_gap=2.0)
+                    else:
+                        resized_img = self.base_img.resize((new_width, new_height), Image.Resampling.LANCZOS)
                     new_photo = ImageTk.PhotoImage(resized_img)
                     
                     canvas.delete("image")
@@ -569,37 +679,19 @@ class UIManager:
                     break
                 file_path, caption_label = item
                 try:
-                    # Check if caption exists in database
                     metadata = self.db.get_image_metadata(file_path)
-                    if metadata and metadata.get('detailed_caption'):
+                    # load_model() blocks only on the first caption if the background warm-up hasn't finished
+                    if self.caption_generator and self.caption_generator.load_model():
+                        # Reuses the stored caption unless the file changed since it was generated
+                        caption = self.caption_generator.get_or_generate_caption(file_path, self.db, metadata)
+                        self.root.after(0, lambda: caption_label.config(text=caption))
+                    elif metadata and metadata.get('detailed_caption'):
                         caption = metadata['detailed_caption']
                         self.root.after(0, lambda: caption_label.config(text=caption))
                         logging.debug(f"Loaded existing caption for {file_path}")
-                    elif not self.caption_generator or not self.caption_generator.is_initialized():
+                    else:
                         self.root.after(0, lambda: caption_label.config(text="Caption unavailable: Florence-2 model not loaded"))
                         logging.warning(f"Florence-2 model not loaded for {file_path}")
-                    else:
-                        caption = self.caption_generator.generate_image_caption(file_path)
-                        self.root.after(0, lambda: caption_label.config(text=caption))
-                        
-                        if metadata is None:
-                            logging.warning(f"No metadata found for {file_path}, using defaults")
-                            metadata = {
-                                'date': '',
-                                'size': 0,
-                                'location': '',
-                                'tags': ''
-                            }
-                        
-                        self.db.add_image(
-                            file_path,
-                            metadata.get('date', ''),
-                            metadata.get('size', 0),
-                            metadata.get('location', ''),
-                            metadata.get('tags', ''),
-                            caption
-                        )
-                        logging.debug(f"Generated caption for {file_path}")
                 except Exception as e:
                     self.root.after(0, lambda: caption_label.config(text=f"Error: {str(e)}"))
                     logging.exception(f"Error generating caption for {file_path}: {str(e)}")
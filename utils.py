@@ -2,6 +2,12 @@ import logging
 import os
 from logging.handlers import RotatingFileHandler
 
+# BLAKE3's SIMD implementation hashes several GB/s per core; stdlib BLAKE2 is the fallback
+try:
+    from blake3 import blake3 as _content_hasher
+except ImportError:
+    from hashlib import blake2b as _content_hasher
+
 def setup_logging():
     try:
         # Create logs directory if it doesn't exist
@@ -42,4 +48,21 @@ def setup_logging():
         # Fallback to console if logging setup fails
         print(f"Failed to initialize logging: {str(e)}")
         logging.basicConfig(level=logging.DEBUG)
-        logging.error(f"Logging setup failed: {str(e)}")
\ No newline at end of file
+        logging.error(f"Logging setup failed: {str(e)}")
+
+def cache_key_from_stat(stat) -> str:
+    # Cheap content key: mtime + size changes whenever the file is rewritten
+    return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+
+def file_cache_key(file_path: str) -> str:
+    return cache_key_from_stat(os.stat(file_path))
+
+
+def file_content_digest(file_path: str, chunk_size: int = 1 << 20) -> str:
+    # Identifies file contents regardless of path or mtime, so moved or copied photos match
+    hasher = _content_hasher()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()